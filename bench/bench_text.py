@@ -0,0 +1,203 @@
+"""
+Benchmarks for the text.py table engine.
+
+Times a cold load of the bundled .tab files, single resolutions of the main
+tables, 10k-resolution batches, and synthetic tables (deep nesting, wide d100
+ranges, thousands of named blocks). Results are written as JSON, so runs from
+different commits can be compared:
+
+  python bench/bench_text.py -o before.json
+  python bench/bench_text.py -o after.json -compare before.json
+"""
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import text
+
+SEED = "bench"
+
+def cold():
+    # Forget everything parsed so far, so the next load starts from scratch.
+    text.compile_entry.cache_clear()
+    text.parse_dice.cache_clear()
+    text._graph_cache = None
+
+def measure(fn, number=1, repeat=5, setup=None):
+    """
+    Run fn number times per repeat; returns seconds per call (best and median).
+    setup, if given, runs untimed before each repeat.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) / number)
+    return {"number": number, "repeat": repeat, "best": min(times), "median": statistics.median(times)}
+
+def load():
+    store = text.TableStore(None)
+    store.refresh()
+    store.load_all()
+    return store.tables, store.named_rules, store.graph
+
+def index():
+    # Only the file-to-block index; files are parsed when first used.
+    store = text.TableStore(None)
+    store.refresh()
+
+def bench_loading(results):
+    results["load.cold"] = measure(load, setup=cold)
+    results["load.index"] = measure(index, setup=cold)
+    results["load.legacy"] = measure(lambda: (text.load_tables(), text.extract_named_blocks()), setup=cold)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, "tables.cache")
+        warm = text.TableStore(cache_path)
+        warm.refresh()
+        warm.load_all()
+        warm.save()
+        def load_cached():
+            store = text.TableStore(cache_path)
+            store.refresh()
+        results["load.cached"] = measure(load_cached, number=20, setup=cold)
+
+def bench_dice(results):
+    results["roll_dice.1d12"] = measure(lambda: text.roll_dice("1D12"), number=100000)
+    results["roll_dice.2d12"] = measure(lambda: text.roll_dice("2D12"), number=100000)
+    pool = text.DicePool(text.derive_random(SEED))
+    results["roll_parsed.pool"] = measure(lambda: text.roll_parsed((2, 12), pool), number=100000)
+
+def bench_resolution(results, tables, named_rules, graph):
+    for user_input in ("room", "hazard", "treasure", "spell"):
+        name = text.find_table(user_input, tables)
+        if name is None:
+            continue
+        counter = iter(range(10 ** 9))
+        def single():
+            text.resolve_table(name, tables, named_rules, rng=text.resolution_rng(SEED, name, next(counter)),
+                               graph=graph)
+        results[f"resolve.{user_input}"] = measure(single, number=2000)
+        results[f"batch10k.{user_input}"] = measure(
+            lambda: text.resolve_many(name, 10000, SEED, tables, named_rules, graph=graph), repeat=3)
+    results["batch10k.room.unseeded"] = measure(
+        lambda: text.resolve_many("room", 10000, None, tables, named_rules, graph=graph), repeat=3)
+    entry = "Room-Furnish() & Wandering-Monsters()\nTreasure-Chest()"
+    results["process_and_resolve_text"] = measure(
+        lambda: text.process_and_resolve_text(entry, tables, named_rules, 0, graph=graph), number=2000)
+
+def write_synthetic(path, depth=400, wide=100, blocks=3000):
+    """
+    Write the synthetic stress tables into the directory path:
+      deep.tab  - a chain of depth named blocks, each calling the next
+      wide.tab  - a 1D100 block with one line per roll, some calling the chain
+      many.tab  - blocks named blocks, each calling a few later ones at random
+    """
+    rng = random.Random(0)
+    lines = []
+    for i in range(depth):
+        nxt = f' & Level-{i + 1}()' if i + 1 < depth else ''
+        lines += [f"Level-{i}", "(   1D12", f'    1-12    "Level {i}"{nxt}', ")", ""]
+    with open(os.path.join(path, "deep.tab"), "w") as f:
+        f.write("1-12    Level-0()\n\n" + "\n".join(lines))
+    lines = ["1-12    Wide()", "", "Wide", "("]
+    for roll in range(1, wide + 1):
+        call = " & Level-390()" if roll % 10 == 0 else ""
+        prefix = "1D100 " if roll == 1 else ""
+        lines.append(f'    {prefix}{roll}-{roll}    "Wide {roll}"{call}')
+    lines.append(")")
+    with open(os.path.join(path, "wide.tab"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+    lines = ["1-12    Block-0()", ""]
+    for i in range(blocks):
+        lines += [f"Block-{i}", "(   1D12"]
+        for start in range(1, 13, 3):
+            calls = "".join(f" & Block-{j}()" for j in rng.sample(range(i + 1, blocks), min(2, blocks - i - 1))
+                            if rng.random() < 0.3)
+            lines.append(f'    {start}-{start + 2}    "Block {i} row {start}"{calls}')
+        lines += [")", ""]
+    with open(os.path.join(path, "many.tab"), "w") as f:
+        f.write("\n".join(lines))
+
+def bench_synthetic(results):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        write_synthetic(tmp)
+        os.chdir(tmp)
+        try:
+            results["synthetic.load.cold"] = measure(load, repeat=3, setup=cold)
+            tables, named_rules, graph = load()
+            results["synthetic.lint"] = measure(lambda: text.lint(tables, named_rules), repeat=3, setup=cold)
+            tables, named_rules, graph = load()
+            counter = iter(range(10 ** 9))
+            for name, max_depth in (("deep", 1000), ("wide", 1000), ("many", text.MAX_DEPTH)):
+                def single():
+                    text.resolve_table(name, tables, named_rules, max_depth=max_depth,
+                                       rng=text.resolution_rng(SEED, name, next(counter)), graph=graph)
+                results[f"synthetic.resolve.{name}"] = measure(single, number=200)
+        finally:
+            os.chdir(cwd)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(report, baseline):
+    # One line per benchmark present in both runs: new/old ratio of the best times.
+    lines = []
+    for name, result in report["results"].items():
+        old = baseline["results"].get(name)
+        if old and old["best"]:
+            ratio = result["best"] / old["best"]
+            lines.append(f"{ratio:7.3f}x  {name}  ({old['best'] * 1e6:.1f} -> {result['best'] * 1e6:.1f} us)")
+    return "\n".join(lines) + "\n"
+
+def main():
+    params = sys.argv[1:]
+    try:
+        output = text.pop_option(params, "-o")
+        baseline = text.pop_option(params, "-compare")
+    except ValueError as e:
+        print(e)
+        print("Usage: python bench/bench_text.py [-o FILE] [-compare BASELINE.json]")
+        return
+    os.chdir(ROOT)
+    results = {}
+    bench_loading(results)
+    bench_dice(results)
+    tables, named_rules, graph = load()
+    bench_resolution(results, tables, named_rules, graph)
+    bench_synthetic(results)
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    data = json.dumps(report, indent=1)
+    if output:
+        with open(output, "w") as f:
+            f.write(data + "\n")
+    else:
+        print(data)
+    if baseline:
+        with open(baseline) as f:
+            sys.stderr.write(compare(report, json.load(f)))
+
+if __name__ == "__main__":
+    main()
@@ -24,6 +24,10 @@ class Room:
     def bottom(self):
         return self.y + self.height
 
+    @property
+    def center(self):
+        return (self.x + self.width / 2, self.y + self.height / 2)
+
 class Corridor:
     def __init__(self, corridor_id, x, y, width, height, room_a_id, room_b_id):
         self.id = corridor_id
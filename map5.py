@@ -1,5 +1,4 @@
 ﻿import random
-import svgwrite
 from itertools import combinations
 from collections import defaultdict
 
@@ -151,7 +150,20 @@ def draw_box_connector(dwg, p1, p2, thickness):
             fill='black'
         ))
 
-def draw_svg(nodes, edges, t_connectors, filename="mst_layout.svg"):
+def route_connectors(nodes, edges, t_connectors):
+    # (u, v, thickness, (p1, mid, p2)) for every MST edge and T-junction branch with a clear path
+    id_map = {n.id: n for n in nodes}
+    pairs = list(edges) + [(center, nid) for center, others in t_connectors.items() for nid in others]
+    connectors = []
+    for u, v in pairs:
+        thickness, _ = random.choice(LINE_WIDTH_OPTIONS)
+        p = find_best_clear_path(id_map[u], id_map[v], nodes, thickness)
+        if p:
+            connectors.append((u, v, thickness, p))
+    return connectors
+
+def draw_svg(nodes, connectors, filename="mst_layout.svg"):
+    import svgwrite
     dwg = svgwrite.Drawing(filename, profile='tiny', size=(GRID_SIZE*SCALE, GRID_SIZE*SCALE))
     for node in nodes:
         dwg.add(dwg.rect(
@@ -162,42 +174,30 @@ def draw_svg(nodes, edges, t_connectors, filename="mst_layout.svg"):
             stroke_width=1*SCALE
         ))
 
-    id_map = {n.id: n for n in nodes}
-
-    for u, v in edges:
-        n1, n2 = id_map[u], id_map[v]
-        thickness, _ = random.choice(LINE_WIDTH_OPTIONS)
-        p = find_best_clear_path(n1, n2, nodes, thickness)
-        if not p:
-            continue
-        p1, mid, p2 = p
+    for u, v, thickness, (p1, mid, p2) in connectors:
         draw_box_connector(dwg, p1, mid, thickness)
         draw_box_connector(dwg, mid, p2, thickness)
 
-    for center, others in t_connectors.items():
-        cnode = id_map[center]
-        for nid in others:
-            onode = id_map[nid]
-            thickness, _ = random.choice(LINE_WIDTH_OPTIONS)
-            p = find_best_clear_path(cnode, onode, nodes, thickness)
-            if not p:
-                continue
-            p1, mid, p2 = p
-            draw_box_connector(dwg, p1, mid, thickness)
-            draw_box_connector(dwg, mid, p2, thickness)
-
     dwg.save()
 
+def build_layout():
+    # One placement attempt: (nodes, edges, t_connectors, connectors), or None if it failed
+    nodes = place_nodes()
+    if not nodes:
+        return None
+    edges = kruskal_mst(nodes)
+    if len(edges) != NODE_COUNT - 1:
+        return None
+    t_connectors = add_t_junctions(nodes, edges)
+    return nodes, edges, t_connectors, route_connectors(nodes, edges, t_connectors)
+
 def generate_layout():
     for attempt in range(MAX_ATTEMPTS):
-        nodes = place_nodes()
-        if not nodes:
-            continue
-        edges = kruskal_mst(nodes)
-        if len(edges) != NODE_COUNT - 1:
+        layout = build_layout()
+        if layout is None:
             continue
-        t_connectors = add_t_junctions(nodes, edges)
-        draw_svg(nodes, edges, t_connectors)
+        nodes, edges, t_connectors, connectors = layout
+        draw_svg(nodes, connectors)
         print(f"✅ CleanFlow v4 SVG generated (zero overlap): mst_layout.svg (attempt {attempt+1})")
         return
     print("❌ Could not generate clean layout after 100 attempts.")
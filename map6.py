@@ -1,5 +1,5 @@
-﻿import random
-import svgwrite
+﻿import argparse
+import random
 import math
 from collections import namedtuple
 import heapq
@@ -16,37 +16,58 @@ NODE_SIZES = [(10, 10), (5, 5)]
 
 # Structures
 Rect = namedtuple('Rect', 'x y w h')
+# paths holds (u, v, cells) for every corridor between nodes u and v
+Layout = namedtuple('Layout', 'width height nodes paths')
+Config = namedtuple('Config', 'width height node_count node_sizes t_shape_percent touching_percent max_attempts',
+                    defaults=(GRID_WIDTH, GRID_HEIGHT, NODE_COUNT, NODE_SIZES, T_SHAPE_PERCENT, TOUCHING_PERCENT,
+                              MAX_ATTEMPTS))
+
+# Occupancy bitmap for overlap detection: one byte per cell, row-major,
+# 0 for free and a marker code for reserved cells
+NODE, PATH = 1, 2
 
-# Hash grid for overlap detection
 class HashGrid:
     def __init__(self, width, height):
-        self.grid = [[None for _ in range(width)] for _ in range(height)]
-        self.reserved = set()
+        self.width = width
+        self.height = height
+        self.cells = bytearray(width * height)
 
     def can_place(self, x, y, w, h):
-        return all((x + dx, y + dy) not in self.reserved 
-                   for dx in range(w) for dy in range(h)
-                   if 0 <= x + dx < GRID_WIDTH and 0 <= y + dy < GRID_HEIGHT)
+        # Only the part of the rectangle inside the grid is checked
+        x0, x1 = max(x, 0), min(x + w, self.width)
+        y0, y1 = max(y, 0), min(y + h, self.height)
+        if x0 >= x1:
+            return True
+        cells = self.cells
+        for row in range(y0 * self.width, y1 * self.width, self.width):
+            if any(cells[row + x0:row + x1]):
+                return False
+        return True
+
+    def reserve(self, x, y, w, h, marker=NODE):
+        fill = bytes([marker]) * w
+        for row in range(y * self.width, (y + h) * self.width, self.width):
+            self.cells[row + x:row + x + w] = fill
 
-    def reserve(self, x, y, w, h, marker='node'):
-        for dx in range(w):
-            for dy in range(h):
-                self.reserved.add((x + dx, y + dy))
-                self.grid[y + dy][x + dx] = marker
+    def reserve_cells(self, cells, marker=PATH):
+        # A corridor may start on a connection point just outside the grid
+        for x, y in cells:
+            if 0 <= x < self.width and 0 <= y < self.height:
+                self.cells[y * self.width + x] = marker
 
 # Node placement with optional touching
 
-def place_nodes(grid, count):
+def place_nodes(grid, config, rng=random):
     nodes = []
-    touching_count = int(count * TOUCHING_PERCENT)
+    touching_count = int(config.node_count * config.touching_percent)
     placed = 0
-    while placed < count:
-        for _ in range(MAX_ATTEMPTS):
-            w, h = random.choice(NODE_SIZES)
+    while placed < config.node_count:
+        for _ in range(config.max_attempts):
+            w, h = rng.choice(config.node_sizes)
             if placed > 0 and touching_count > 0:
                 # Try placing adjacent to an existing node
-                base = random.choice(nodes)
-                side = random.choice(['top', 'bottom', 'left', 'right'])
+                base = rng.choice(nodes)
+                side = rng.choice(['top', 'bottom', 'left', 'right'])
                 if side == 'top':
                     x = base.x
                     y = base.y - h
@@ -59,17 +80,17 @@ def place_nodes(grid, count):
                 else:  # right
                     x = base.x + base.w
                     y = base.y
-                if 0 <= x < GRID_WIDTH - w and 0 <= y < GRID_HEIGHT - h and grid.can_place(x, y, w, h):
-                    grid.reserve(x, y, w, h, marker='node')
+                if 0 <= x < grid.width - w and 0 <= y < grid.height - h and grid.can_place(x, y, w, h):
+                    grid.reserve(x, y, w, h, marker=NODE)
                     nodes.append(Rect(x, y, w, h))
                     touching_count -= 1
                     placed += 1
                     break
             else:
-                x = random.randint(0, GRID_WIDTH - w)
-                y = random.randint(0, GRID_HEIGHT - h)
+                x = rng.randint(0, grid.width - w)
+                y = rng.randint(0, grid.height - h)
                 if grid.can_place(x, y, w, h):
-                    grid.reserve(x, y, w, h, marker='node')
+                    grid.reserve(x, y, w, h, marker=NODE)
                     nodes.append(Rect(x, y, w, h))
                     placed += 1
                     break
@@ -112,33 +133,83 @@ def build_mst(nodes):
 
     return mst
 
-def heuristic(a, b):
-    return abs(a[0] - b[0]) + abs(a[1] - b[1])
-
 def astar(grid, start, goal):
-    open_set = []
-    heapq.heappush(open_set, (0 + heuristic(start, goal), 0, start, [start]))
-    visited = set()
+    return Router(grid).route(start, goal)
 
-    while open_set:
-        est_total, cost, current, path = heapq.heappop(open_set)
-        if current == goal:
-            return path
+class Router:
+    """
+    A* over the free cells of a HashGrid. Cells are integer ids y * width + x;
+    the cost, parent and stamp arrays are allocated once and reused by every
+    search, so one router serves all the corridors of a layout. It reads the
+    grid's bitmap directly and sees cells reserved between searches.
+    """
+    def __init__(self, grid):
+        self.grid = grid
+        size = grid.width * grid.height
+        self.cost = [0] * size
+        self.parent = [0] * size
+        # stamp[i] == search when cell i has a cost in the current search
+        self.stamp = [0] * size
+        self.search = 0
+        self.heap = []
 
-        if current in visited:
-            continue
-        visited.add(current)
-
-        x, y = current
-        for dx, dy in [(-1,0),(1,0),(0,-1),(0,1)]:
-            nx, ny = x + dx, y + dy
-            if 0 <= nx < GRID_WIDTH and 0 <= ny < GRID_HEIGHT and (nx, ny) not in grid.reserved:
-                next_node = (nx, ny)
-                if next_node not in visited:
-                    new_cost = cost + 1
-                    est = new_cost + heuristic(next_node, goal)
-                    heapq.heappush(open_set, (est, new_cost, next_node, path + [next_node]))
-    return None
+    def cell(self, point):
+        x, y = point
+        if 0 <= x < self.grid.width and 0 <= y < self.grid.height:
+            return y * self.grid.width + x
+        return None
+
+    def path(self, node):
+        width, parent = self.grid.width, self.parent
+        path = []
+        while node >= 0:
+            path.append((node % width, node // width))
+            node = parent[node]
+        path.reverse()
+        return path
+
+    def route(self, start, goal):
+        """Shortest 4-connected path of free cells from start to goal, or None."""
+        return self.route_between([start], [goal])
+
+    def route_between(self, sources, targets):
+        """
+        Shortest path from any of the sources to any of the targets, found in a
+        single search seeded with every source. The heuristic is the distance
+        to the bounding box of the targets. Points outside the grid are ignored.
+        """
+        starts = [n for n in map(self.cell, sources) if n is not None]
+        goals = {n for n in map(self.cell, targets) if n is not None}
+        if not starts or not goals:
+            return None
+        width, last_row = self.grid.width, self.grid.height - 1
+        cells, cost, parent, stamp = self.grid.cells, self.cost, self.parent, self.stamp
+        x0, x1 = min(n % width for n in goals), max(n % width for n in goals)
+        y0, y1 = min(n // width for n in goals), max(n // width for n in goals)
+        self.search += 1
+        search = self.search
+        heap = self.heap
+        heap.clear()
+        push, pop = heapq.heappush, heapq.heappop
+        for s in starts:
+            if stamp[s] != search:
+                y, x = divmod(s, width)
+                stamp[s], cost[s], parent[s] = search, 0, -1
+                push(heap, (max(x0 - x, x - x1, 0) + max(y0 - y, y - y1, 0), 0, s))
+        while heap:
+            _, c, node = pop(heap)
+            if node in goals:
+                return self.path(node)
+            if c > cost[node]:
+                continue  # stale entry, the cell was reached more cheaply
+            y, x = divmod(node, width)
+            c += 1
+            for n, nx, ny, ok in ((node - 1, x - 1, y, x > 0), (node + 1, x + 1, y, x < width - 1),
+                                  (node - width, x, y - 1, y > 0), (node + width, x, y + 1, y < last_row)):
+                if ok and not cells[n] and (stamp[n] != search or c < cost[n]):
+                    stamp[n], cost[n], parent[n] = search, c, node
+                    push(heap, (c + max(x0 - nx, nx - x1, 0) + max(y0 - ny, ny - y1, 0), c, n))
+        return None
 
 def get_connection_points(node):
     x, y, w, h = node
@@ -151,72 +222,72 @@ def get_connection_points(node):
         points.append((x + w, y + dy))
     return points
 
-def route_connection(grid, n1, n2):
-    points1 = get_connection_points(n1)
-    points2 = get_connection_points(n2)
-    for p1 in points1:
-        for p2 in points2:
-            path = astar(grid, p1, p2)
-            if path:
-                return path
-    return None
-
-for attempt in range(MAX_ATTEMPTS):
-    grid = HashGrid(GRID_WIDTH, GRID_HEIGHT)
-    nodes = place_nodes(grid, NODE_COUNT)
-    if nodes:
-        mst = build_mst(nodes)
-        break
-else:
-    raise RuntimeError("Failed to place all nodes after maximum attempts")
-
-connection_paths = []
-for u, v in mst:
-    n1, n2 = nodes[u], nodes[v]
-    path = route_connection(grid, n1, n2)
-    if path:
-        for cell in path:
-            grid.reserved.add(cell)
-        connection_paths.append((u, v, path))
-    else:
-        raise RuntimeError("Failed to route connection")
+def route_connection(router, n1, n2):
+    return router.route_between(get_connection_points(n1), get_connection_points(n2))
 
-def find_nearest_unused_node(used_pairs, node_index, total_nodes):
+def find_nearest_unused_node(nodes, used_pairs, node_index):
     connected = set()
-    for u, v in used_pairs:
+    for u, v, *_ in used_pairs:
         connected.add(u)
         connected.add(v)
-    candidates = [i for i in range(total_nodes) if i != node_index and i not in connected]
+    candidates = [i for i in range(len(nodes)) if i != node_index and i not in connected]
     if not candidates:
         return None
     candidates.sort(key=lambda i: node_distance(nodes[node_index], nodes[i]))
-    return candidates[0] if candidates else None
-
-num_t_shapes = max(1, round(len(mst) * T_SHAPE_PERCENT))
-t_shape_paths = []
-used_t_nodes = set()
-random.shuffle(connection_paths)
-
-for u, v, main_path in connection_paths:
-    if len(t_shape_paths) >= num_t_shapes:
-        break
-    base_node = random.choice([u, v])
-    t_node = find_nearest_unused_node(mst + t_shape_paths, base_node, len(nodes))
-    if t_node is None or t_node in used_t_nodes:
-        continue
-    third = nodes[t_node]
-    third_path = route_connection(grid, nodes[base_node], third)
-    if third_path:
-        for cell in third_path:
-            grid.reserved.add(cell)
-        t_shape_paths.append((base_node, t_node, third_path))
-        used_t_nodes.add(t_node)
-
-all_paths = connection_paths + t_shape_paths
-
-def render_svg(filename, nodes, paths):
-    dwg = svgwrite.Drawing(filename, profile='tiny', size=(f'{GRID_WIDTH * CELL_SIZE}px', f'{GRID_HEIGHT * CELL_SIZE}px'))
-    for idx, node in enumerate(nodes):
+    return candidates[0]
+
+def generate_layout(config=Config(), seed=None):
+    """
+    Place config.node_count nodes, join them along their minimum spanning tree
+    and add T-shaped branches to a share of the corridors. All randomness comes
+    from a random.Random(seed), so the same config and seed give the same
+    Layout. Raises RuntimeError if the nodes can't be placed or a corridor
+    can't be routed.
+    """
+    rng = random.Random(seed)
+    for attempt in range(config.max_attempts):
+        grid = HashGrid(config.width, config.height)
+        nodes = place_nodes(grid, config, rng)
+        if nodes:
+            mst = build_mst(nodes)
+            break
+    else:
+        raise RuntimeError("Failed to place all nodes after maximum attempts")
+
+    router = Router(grid)
+    connection_paths = []
+    for u, v in mst:
+        path = route_connection(router, nodes[u], nodes[v])
+        if path:
+            grid.reserve_cells(path)
+            connection_paths.append((u, v, path))
+        else:
+            raise RuntimeError("Failed to route connection")
+
+    num_t_shapes = max(1, round(len(mst) * config.t_shape_percent))
+    t_shape_paths = []
+    used_t_nodes = set()
+    rng.shuffle(connection_paths)
+
+    for u, v, main_path in connection_paths:
+        if len(t_shape_paths) >= num_t_shapes:
+            break
+        base_node = rng.choice([u, v])
+        t_node = find_nearest_unused_node(nodes, mst + t_shape_paths, base_node)
+        if t_node is None or t_node in used_t_nodes:
+            continue
+        third_path = route_connection(router, nodes[base_node], nodes[t_node])
+        if third_path:
+            grid.reserve_cells(third_path)
+            t_shape_paths.append((base_node, t_node, third_path))
+            used_t_nodes.add(t_node)
+
+    return Layout(config.width, config.height, nodes, connection_paths + t_shape_paths)
+
+def render_svg(filename, layout):
+    import svgwrite
+    dwg = svgwrite.Drawing(filename, profile='tiny', size=(f'{layout.width * CELL_SIZE}px', f'{layout.height * CELL_SIZE}px'))
+    for idx, node in enumerate(layout.nodes):
         x, y = node.x * CELL_SIZE, node.y * CELL_SIZE
         w, h = node.w * CELL_SIZE, node.h * CELL_SIZE
         dwg.add(dwg.rect(insert=(x, y), size=(w, h), fill='lightblue', stroke='black', stroke_width=0.5))
@@ -226,10 +297,21 @@ def render_svg(filename, nodes, paths):
             text_anchor="middle",
             font_size=8
         ))
-    for u, v, path in paths:
+    for u, v, path in layout.paths:
         path_line = [(x * CELL_SIZE + CELL_SIZE / 2, y * CELL_SIZE + CELL_SIZE / 2) for x, y in path]
         dwg.add(dwg.polyline(points=path_line, stroke='red', fill='none', stroke_width=0.5))
     dwg.save()
 
-output_path = 'mst_layout.svg'
-render_svg(output_path, nodes, all_paths)
\ No newline at end of file
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a node layout joined by corridors and write it as SVG.")
+    parser.add_argument('-seed', type=int, default=None)
+    parser.add_argument('-nodes', type=int, default=NODE_COUNT)
+    parser.add_argument('-width', type=int, default=GRID_WIDTH)
+    parser.add_argument('-height', type=int, default=GRID_HEIGHT)
+    parser.add_argument('-o', dest='output', default='mst_layout.svg')
+    args = parser.parse_args(argv)
+    layout = generate_layout(Config(width=args.width, height=args.height, node_count=args.nodes), args.seed)
+    render_svg(args.output, layout)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Batch map generation: fans N seeded layout jobs from one of the map generators
+out over a process pool and writes one compact JSON layout per line.
+
+  python mapbatch.py map6 -count 5000 -seed nightly -o maps.jsonl
+
+Job i is seeded with "SEED:GENERATOR:i", so a seeded batch gives the same maps
+for any number of workers, and any single map can be regenerated on its own.
+Failed jobs are written with "layout": null.
+"""
+import argparse
+import contextlib
+import io
+import json
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import map as map_
+import map3
+import map4
+import map5
+import map6
+
+# Settings from the example usage in each script
+MAP_ROOM_CONFIGS = [(40, 40), (60, 30), (50, 50), (30, 60)]
+MAP3_NODE_SIZES = [(20, 20), (30, 20), (20, 30), (40, 30), (30, 40)]
+MAP3_SEGMENTS = [(30, 10), (40, 10), (50, 10), (30, 10), (40, 10), (150, 10)]
+MAP4_NODE_SIZES = [(20, 20), (30, 20), (20, 30), (40, 30), (30, 40)]
+MAP4_SEGMENTS = [(30, 10), (40, 10), (50, 10), (150, 10)]
+MAP4_ATTEMPTS = 100
+
+def tree_layout(nodes, edges):
+    # map3 and map4: {index: {'rect': ...}} plus (parent, child, segment rects)
+    return {"nodes": [nodes[i]['rect'] for i in sorted(nodes)], "edges": edges}
+
+def gen_map(seed):
+    layout = map_.MapGenerator(500, 500, MAP_ROOM_CONFIGS, corridor_thickness=20, num_rooms=10,
+                               seed=seed).generate_map()
+    return {"width": layout.width, "height": layout.height,
+            "rooms": [(r.id, r.x, r.y, r.width, r.height, r.doors) for r in layout.rooms],
+            "corridors": [(c.id, c.x, c.y, c.width, c.height, c.room_a_id, c.room_b_id)
+                          for c in layout.corridors]}
+
+def gen_map3(seed):
+    random.seed(seed)
+    nodes, edges = map3.generate_valid_layout(14, MAP3_NODE_SIZES, MAP3_SEGMENTS)
+    return None if nodes is None else tree_layout(nodes, edges)
+
+def gen_map4(seed):
+    random.seed(seed)
+    for _ in range(MAP4_ATTEMPTS):
+        nodes, edges = map4.generate_tree_layout(30, MAP4_NODE_SIZES, MAP4_SEGMENTS)
+        if nodes:
+            return tree_layout(nodes, edges)
+    return None
+
+def gen_map5(seed):
+    random.seed(seed)
+    for _ in range(map5.MAX_ATTEMPTS):
+        layout = map5.build_layout()
+        if layout:
+            nodes, edges, t_connectors, connectors = layout
+            return {"size": map5.GRID_SIZE, "nodes": [(n.x, n.y, n.w, n.h) for n in nodes],
+                    "edges": edges, "t_connectors": t_connectors, "connectors": connectors}
+    return None
+
+def gen_map6(seed):
+    try:
+        return map6.generate_layout(seed=seed)._asdict()
+    except RuntimeError:
+        return None
+
+GENERATORS = {"map": gen_map, "map3": gen_map3, "map4": gen_map4, "map5": gen_map5, "map6": gen_map6}
+
+def generate(job):
+    """Run one job (generator, seed, index) and return its layout as a JSON line."""
+    generator, seed, index = job
+    job_seed = f"{seed}:{generator}:{index}"
+    # The older generators report progress on stdout, which carries the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        layout = GENERATORS[generator](job_seed)
+    return json.dumps({"generator": generator, "index": index, "seed": job_seed, "layout": layout},
+                      separators=(",", ":"))
+
+def generate_batch(generator, count, seed=None, workers=None, chunksize=16):
+    """
+    Yield the JSON lines of count layouts in job order. workers=1 runs in this
+    process; otherwise jobs go to a ProcessPoolExecutor in chunks of chunksize.
+    """
+    if seed is None:
+        seed = random.SystemRandom().randrange(2 ** 32)
+    jobs = [(generator, seed, index) for index in range(count)]
+    if workers == 1:
+        yield from (generate(job) for job in jobs)
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            yield from executor.map(generate, jobs, chunksize=chunksize)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate many seeded map layouts in parallel.")
+    parser.add_argument('generator', choices=sorted(GENERATORS))
+    parser.add_argument('-count', type=int, default=100)
+    parser.add_argument('-seed', default=None)
+    parser.add_argument('-workers', type=int, default=None)
+    parser.add_argument('-o', dest='output', default=None)
+    args = parser.parse_args(argv)
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for line in generate_batch(args.generator, args.count, args.seed, args.workers):
+            out.write(line + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == '__main__':
+    main()
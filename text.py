@@ -1,72 +1,290 @@
 ﻿MAX_DEPTH = 50  # Maximum recursion depth
 DEFAULT_DICE = "1D12"  # Global default dice; if no block-specific notation is provided
-VERBOSE = False  # Global verbosity flag
+VERBOSE = False  # Default verbosity; each Resolver carries its own flag
 
 import os
+import io
 import re
+import json
+import hashlib
+import pickle
 import random
 import glob
 import sys
+import time
+import itertools
+from collections import Counter
+from bisect import bisect_left, bisect_right
+from fractions import Fraction
+from functools import lru_cache
 
-def roll_dice(notation):
+# Patterns are compiled once; entries are tokenized with them at load time.
+DICE_RE = re.compile(r'(\d+)[dD](\d+)')
+CALL_RE = re.compile(r'([A-Za-z0-9_\-]+)\(\)')
+TABLE_LINE_RE = re.compile(r'(\d+)(?:-(\d+))?\s+(.+)')
+BLOCK_NAME_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_\-]*$')
+
+@lru_cache(maxsize=None)
+def parse_dice(notation):
     """
-    Parse a dice notation like "1D12" or "2D12" and return (total, [individual_rolls]).
+    Parse a dice notation like "2D12" into (count, sides). Anything else rolls as 1D12.
     """
-    match = re.fullmatch(r'(\d+)[dD](\d+)', notation)
+    match = DICE_RE.fullmatch(notation)
     if match:
-        num = int(match.group(1))
-        sides = int(match.group(2))
-        total = 0
-        rolls = []
-        for _ in range(num):
-            r = random.randint(1, sides)
-            rolls.append(r)
-            total += r
-        return total, rolls
-    else:
-        r = random.randint(1, 12)
+        return int(match.group(1)), int(match.group(2))
+    return 1, 12
+
+def roll_dice(notation, rng=random):
+    """
+    Parse a dice notation like "1D12" or "2D12" and return (total, [individual_rolls]).
+    rng is anything with a randint(a, b) method: the random module, a random.Random
+    or a DicePool.
+    """
+    return roll_parsed(parse_dice(notation), rng)
+
+def roll_parsed(dice, rng=random):
+    # Roll a pre-parsed (count, sides) pair; returns (total, [individual_rolls]).
+    count, sides = dice
+    if count == 1:
+        r = rng.randint(1, sides)
         return r, [r]
+    rolls = [rng.randint(1, sides) for _ in range(count)]
+    return sum(rolls), rolls
+
+DEFAULT_ROLL = parse_dice(DEFAULT_DICE)
+
+class DicePool:
+    """
+    Pre-draws die faces in bulk with random.choices and hands them out one at a
+    time through randint(), so it can stand in for an RNG in roll_dice. One pool
+    shared by a whole batch replaces a randint call per die with a list pop.
+    Draws start small and double up to block, so a pool used for a single
+    resolution does not pre-draw thousands of faces.
+    """
+    def __init__(self, rng=None, block=4096):
+        self.rng = rng or random.Random()
+        self.block = block
+        self.buffers = {}  # (low, high) -> pre-drawn faces
+        self.sizes = {}    # (low, high) -> size of the next draw
+
+    def randint(self, a, b):
+        buffer = self.buffers.get((a, b))
+        if not buffer:
+            size = self.sizes.get((a, b), 16)
+            self.sizes[(a, b)] = min(size * 2, self.block)
+            buffer = self.buffers[(a, b)] = self.rng.choices(range(a, b + 1), k=size)
+        return buffer.pop()
+
+def derive_random(seed, *path):
+    """
+    A random.Random for one stream, seeded from seed plus the stream's position
+    (table name, batch index, ...). random.seed hashes string seeds with SHA-512,
+    so the stream is the same in every process and on every run.
+    """
+    return random.Random(":".join(str(part) for part in (seed,) + path))
+
+def resolution_rng(seed, *path):
+    """
+    The dice source for one resolution: a DicePool over the stream derived from
+    (seed, *path), or a fresh OS-seeded random.Random when seed is None.
+    """
+    if seed is None:
+        return random.Random()
+    return DicePool(derive_random(seed, *path))
+
+def tokenize_line(line):
+    """
+    Tokenize one stripped entry line into the tuple the resolver walks:
+    (text, lower, call, display, calls) where call is the lowered name if the whole
+    line is a "Name()" call, display is the text with surrounding quotes removed,
+    and calls lists every (Name, name) pair for the "Name()" calls in the line.
+    """
+    full = CALL_RE.fullmatch(line)
+    display = line[1:-1] if line.startswith('"') and line.endswith('"') else line
+    calls = tuple((match, match.lower()) for match in CALL_RE.findall(line))
+    return line, line.lower(), full.group(1).lower() if full else None, display, calls
+
+def tokenize_text(text):
+    return tuple(tokenize_line(line.strip()) for line in text.splitlines())
+
+class Entry:
+    """
+    One table entry, tokenized once at load time:
+      quoted - the text without its quotes when the whole entry is one "..." string
+      group  - the table names of a [[A() & B()]] entry
+      lines  - the entry's lines as tokenize_line tuples
+      parts  - the stripped (part, lowered part) pieces of an & composite
+    """
+    __slots__ = ("text", "key", "quoted", "group", "lines", "parts")
+
+    def __init__(self, text):
+        self.text = text
+        self.key = text.strip().lower()
+        self.quoted = text[1:-1] if text.startswith('"') and text.endswith('"') else None
+        self.group = None
+        if text.startswith('[[') and text.endswith(']]'):
+            self.group = tuple(p.strip().replace("()", "").lower() for p in text[2:-2].split("&"))
+        self.lines = tokenize_text(text)
+        self.parts = None
+        if "&" in text:
+            self.parts = tuple((p.strip(), p.strip().lower()) for p in text.split("&"))
+
+    def __str__(self):
+        return self.text
+
+    def state(self):
+        return self.text, self.key, self.quoted, self.group, self.lines, self.parts
+
+    @classmethod
+    def from_state(cls, state):
+        entry = cls.__new__(cls)
+        entry.text, entry.key, entry.quoted, entry.group, entry.lines, entry.parts = state
+        return entry
+
+@lru_cache(maxsize=8192)
+def compile_entry(text):
+    # Entries are immutable, so lines with the same text share one Entry.
+    return Entry(text)
+
+class RollTable:
+    """
+    A compiled roll table: sorted, non-overlapping roll ranges with each entry
+    stored once, so memory and build time follow the number of lines, not the
+    width of their ranges. lookup() bisects the range starts instead of scanning
+    every roll. Where two lines cover the same roll the earlier line wins, as it
+    always has; the rolls a line loses that way are recorded in overlaps as it is
+    added, and gaps() lists the rolls no line covers.
+    """
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.slots = []    # index into self.entries for each range
+        self.entries = []  # one Entry per table line
+        self.spans = []    # the (start, end) each table line was written with
+        self.overlaps = [] # (slot, start, end) pieces of lines already taken by earlier lines
+
+    def add(self, start, end, content):
+        slot = len(self.entries)
+        self.entries.append(content)
+        self.spans.append((start, end))
+        # Insert only the parts of [start, end] not already covered by earlier lines.
+        i = bisect_left(self.ends, start)
+        lo = start
+        while lo <= end:
+            if i < len(self.starts) and self.starts[i] <= end:
+                if self.starts[i] > lo:
+                    self._insert(i, lo, self.starts[i] - 1, slot)
+                    i += 1
+                self._overlap(slot, max(lo, self.starts[i]), min(end, self.ends[i]))
+                lo = self.ends[i] + 1
+                i += 1
+            else:
+                self._insert(i, lo, end, slot)
+                break
+
+    def _overlap(self, slot, start, end):
+        last = self.overlaps[-1] if self.overlaps else None
+        if last is not None and last[0] == slot and last[2] == start - 1:
+            self.overlaps[-1] = (slot, last[1], end)
+        else:
+            self.overlaps.append((slot, start, end))
+
+    def gaps(self, low, high):
+        # The (start, end) ranges within low..high that no line covers.
+        found = []
+        lo = low
+        for start, end in zip(self.starts, self.ends):
+            if start > high:
+                break
+            if start > lo:
+                found.append((lo, start - 1))
+            lo = max(lo, end + 1)
+        if lo <= high:
+            found.append((lo, high))
+        return found
+
+    def _insert(self, i, start, end, slot):
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.slots.insert(i, slot)
+
+    def lookup(self, roll):
+        i = bisect_right(self.starts, roll) - 1
+        if i >= 0 and roll <= self.ends[i]:
+            return self.entries[self.slots[i]]
+        return None
+
+    def __iter__(self):
+        # Yields (start, end, entry) for each range, in roll order.
+        for start, end, slot in zip(self.starts, self.ends, self.slots):
+            yield start, end, self.entries[slot]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def state(self, memo):
+        # Plain-data form, so the on-disk cache does not depend on this module's name.
+        # memo maps id(entry) -> entry state, so shared entries are pickled once.
+        return (self.starts, self.ends, self.slots, self.spans, self.overlaps,
+                [memo.setdefault(id(entry), entry.state()) for entry in self.entries])
+
+    @classmethod
+    def from_state(cls, state, memo):
+        # memo maps id(entry state) -> Entry, restoring the sharing state() recorded.
+        table = cls()
+        table.starts, table.ends, table.slots, table.spans, table.overlaps, entries = state
+        table.entries = [memo.get(id(entry)) or memo.setdefault(id(entry), Entry.from_state(entry))
+                         for entry in entries]
+        return table
+
+def parse_table_line(line, table):
+    match = TABLE_LINE_RE.match(line)
+    if match:
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else start
+        table.add(start, end, compile_entry(match.group(3).strip()))
 
 def parse_inline_table(lines):
-    table = []
+    table = RollTable()
     for line in lines:
-        line = line.strip()
-        match = re.match(r'(\d+)(?:-(\d+))?\s+(.+)', line)
-        if match:
-            start = int(match.group(1))
-            end = int(match.group(2)) if match.group(2) else start
-            content = match.group(3).strip()
-            for i in range(start, end + 1):
-                table.append((i, content))
+        parse_table_line(line.strip(), table)
     return table
 
 def extract_named_blocks():
     blocks = {}
     for filepath in glob.glob("*.tab") + glob.glob("*.txt"):
         with open(filepath, 'r') as f:
-            lines = [line.rstrip() for line in f if line.strip() and not line.strip().startswith('#')]
-        i = 0
-        while i < len(lines):
-            line = lines[i]
-            if re.match(r'^[A-Za-z_][A-Za-z0-9_\-]*$', line):
-                name = line.strip().lower()
+            blocks.update(extract_file_blocks(f))
+    return blocks
+
+def extract_file_blocks(f):
+    """
+    Collect the raw lines of every named block in one open .tab/.txt file.
+    """
+    blocks = {}
+    lines = [line.rstrip() for line in f if line.strip() and not line.strip().startswith('#')]
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if BLOCK_NAME_RE.match(line):
+            name = line.strip().lower()
+            i += 1
+            if i < len(lines) and lines[i].strip().startswith('('):
+                depth = 1
+                block_lines = [line, lines[i]]
                 i += 1
-                if i < len(lines) and lines[i].strip().startswith('('):
-                    depth = 1
-                    block_lines = [line, lines[i]]
-                    i += 1
-                    while i < len(lines) and depth > 0:
-                        block_lines.append(lines[i])
-                        if '(' in lines[i]:
-                            depth += lines[i].count('(')
-                        if ')' in lines[i]:
-                            depth -= lines[i].count(')')
-                        i += 1
-                    blocks[name] = block_lines
-                else:
+                while i < len(lines) and depth > 0:
+                    block_lines.append(lines[i])
+                    if '(' in lines[i]:
+                        depth += lines[i].count('(')
+                    if ')' in lines[i]:
+                        depth -= lines[i].count(')')
                     i += 1
+                blocks[name] = block_lines
             else:
                 i += 1
+        else:
+            i += 1
     return blocks
 
 def parse_named_block(lines):
@@ -82,6 +300,13 @@ def parse_named_block(lines):
     Even if the dice notation (e.g. "2D12") isn’t on its own line,
     we extract it from the first token of the first table line.
     """
+    name, parsed_tables = parse_block_tables(lines)
+    return name, NamedBlock(name, parsed_tables)
+
+def parse_block_tables(lines):
+    """
+    Parse a named block's lines into (name, [(dice_notation, RollTable), ...]).
+    """
     name = lines[0].strip().lower()
     stack = []
     current = []
@@ -96,7 +321,7 @@ def parse_named_block(lines):
             if current:
                 first_line = current[0].strip()
                 tokens = first_line.split()
-                if tokens and re.fullmatch(r'\d+[dD]\d+', tokens[0]):
+                if tokens and DICE_RE.fullmatch(tokens[0]):
                     dice_notation = tokens[0]
                     # Remove that token from the first line:
                     rest = tokens[1:]
@@ -110,45 +335,88 @@ def parse_named_block(lines):
             dice_notation = None
         else:
             current.append(line)
-    def resolve_nested():
+    return name, parsed_tables
+
+class NamedBlock:
+    """
+    The resolver for a named block; named_rules maps block names to these.
+    Everything that does not depend on the roll (dice, composite splits,
+    tokenized results) is worked out once, here. Calling it rolls the block and
+    returns the result as tokenized lines.
+    """
+    def __init__(self, name, parsed_tables):
+        self.name = name
+        self.parsed_tables = parsed_tables
+        self.outer = None
+        self.nested = None
         if not parsed_tables:
-            return ""
+            return
         # Use the first mini-table (outer table) from the block.
-        notation, outer = parsed_tables[0]
+        notation, self.outer = parsed_tables[0]
         # For example, if the block is "spell" and no notation was found, force "2D12"
         if name == "spell" and (notation is None):
-            roll_notation = "2D12"
+            self.notation = "2D12"
         else:
-            roll_notation = notation if notation is not None else DEFAULT_DICE
-        debug_print(f"Using dice notation '{roll_notation}' for block '{name}'")
-        has_composite = any("&" in entry for (r, entry) in outer)
+            self.notation = notation if notation is not None else DEFAULT_DICE
+        self.dice = parse_dice(self.notation)
+        self.has_composite = any(entry.parts is not None for entry in self.outer.entries)
+        if len(parsed_tables) > 1:
+            notation2, subtable = parsed_tables[1]
+            self.nested = (parse_dice(notation2 if notation2 is not None else DEFAULT_DICE), subtable)
+        # Composite entries resolve to their parts minus the block's own name. Those
+        # with a "(" part roll the nested table each time; the rest are fixed.
+        self.composites = {}
+        for entry in self.outer.entries:
+            if entry.parts is not None:
+                parts = [part for part, lower in entry.parts if lower != name]
+                if self.nested is not None and any(part.startswith("(") for part in parts):
+                    self.composites[entry] = parts
+                else:
+                    self.composites[entry] = tokenize_text("\n".join(parts))
+
+    def __call__(self, rng=random, node=None, verbose=False, profiler=None):
+        # node, if given, is the "block" ResultNode that records the roll (and,
+        # when verbose, the notes about it); profiler, if given, counts the rerolls.
+        if self.outer is None:
+            return ()
+        name = self.name
+        verbose = verbose and node is not None
+        if verbose:
+            debug_print(node, f"Using dice notation '{self.notation}' for block '{name}'")
         attempts = 0
         entry = None
         while attempts < 10:
-            roll, rolls = roll_dice(roll_notation)
-            entry = next((c for r, c in outer if r == roll), None)
-            debug_print(f"  → [Nested roll in {name}]: Rolled {roll} (rolls: {rolls}) resulting in: {entry}")
-            if entry is not None and has_composite and entry.strip().lower() == name:
+            roll, rolls = roll_parsed(self.dice, rng)
+            entry = self.outer.lookup(roll)
+            if verbose:
+                debug_print(node, f"  → [Nested roll in {name}]: Rolled {roll} (rolls: {rolls}) resulting in: {entry}")
+            if entry is not None and self.has_composite and entry.key == name:
                 attempts += 1
                 continue
             break
-        if entry and "&" in entry:
-            parts = [p.strip() for p in entry.split("&")]
-            output = []
-            for part in parts:
-                if part.lower() == name:
-                    continue
-                if part.startswith("(") and len(parsed_tables) > 1:
-                    notation2, subtable = parsed_tables[1]
-                    roll_notation2 = notation2 if notation2 is not None else DEFAULT_DICE
-                    subroll, sub_rolls = roll_dice(roll_notation2)
-                    subentry = next((c for r, c in subtable if r == subroll), None)
-                    output.append(f"[Nested roll in {name} nested]: Rolled {subroll} (rolls: {sub_rolls}) resulting in: {subentry}")
-                else:
-                    output.append(part)
-            return "\n".join(output)
-        return entry if entry is not None else ""
-    return name, resolve_nested
+        if attempts and profiler is not None:
+            profiler.rerolls[name] += attempts
+        if node is not None:
+            node.roll, node.rolls, node.entry = roll, rolls, entry.text if entry is not None else None
+        if entry is None:
+            return ()
+        if entry.parts is None:
+            return entry.lines
+        result = self.composites[entry]
+        if isinstance(result, tuple):
+            return result
+        subdice, subtable = self.nested
+        output = []
+        for part in result:
+            if part.startswith("("):
+                subroll, sub_rolls = roll_parsed(subdice, rng)
+                output.append(self.nested_line(subroll, sub_rolls, subtable.lookup(subroll)))
+            else:
+                output.append(part)
+        return tokenize_text("\n".join(output))
+
+    def nested_line(self, subroll, sub_rolls, subentry):
+        return f"[Nested roll in {self.name} nested]: Rolled {subroll} (rolls: {sub_rolls}) resulting in: {subentry}"
 
 def load_tables():
     tables = {}
@@ -158,135 +426,1725 @@ def load_tables():
     return tables
 
 def parse_tab_file(filename):
-    table = []
     with open(filename, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith('#'):
-                continue
-            match = re.match(r'(\d+)(?:-(\d+))?\s+(.+)', line)
-            if match:
-                start = int(match.group(1))
-                end = int(match.group(2)) if match.group(2) else start
-                content = match.group(3).strip()
-                for roll in range(start, end + 1):
-                    table.append((roll, content))
+        return parse_tab_lines(f)
+
+def parse_tab_lines(lines):
+    table = RollTable()
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parse_table_line(line, table)
     return table
 
-# --- Helper printing functions ---
-def debug_print(msg):
-    if VERBOSE:
-        print(msg)
+# --- Pre-parsed table cache ---
+CACHE_FILE = ".tables.cache"  # Parsed tables and named blocks, kept next to the .tab files
+CACHE_VERSION = 5  # Bump whenever the cached parse format changes
 
-def final_print(indent, msg):
-    # In non-verbose mode, print without any leading spaces.
-    if VERBOSE:
-        print(f"{indent}→ Output: {msg}")
-    else:
-        print(f"{msg}")
+def text_lines(data):
+    # Decode raw file bytes exactly as open(filepath, 'r') would.
+    return io.TextIOWrapper(io.BytesIO(data))
 
-resolved_stack = set()
+def index_file(data, digest, st):
+    """
+    A cache record for one .tab/.txt file (given its raw bytes) that only lists
+    its named blocks; parse_record fills in the parsed table and blocks.
+    """
+    return {"mtime": st.st_mtime_ns, "size": st.st_size, "digest": digest,
+            "names": list(extract_file_blocks(text_lines(data))), "parsed": False, "table": None, "blocks": None}
 
-def process_and_resolve_text(text, tables, named_rules, depth, parent_table=None, current_named=None):
-    indent = "  " * depth if VERBOSE else ""
-    if depth > MAX_DEPTH:
-        debug_print(indent + "[Maximum recursion depth reached]")
-        return
-    lines = text.splitlines()
-    for line in lines:
-        line = line.strip()
-        match_full = re.fullmatch(r'([A-Za-z0-9_\-]+)\(\)', line)
-        if match_full:
-            name_candidate = match_full.group(1).lower()
-            if name_candidate in named_rules:
-                debug_print(f"{indent}→ Resolving named block: {line}")
-                result = named_rules[name_candidate]()
-                process_and_resolve_text(result, tables, named_rules, depth + 1, parent_table, current_named=name_candidate)
-                continue
-        if line.lower() in named_rules:
-            if current_named is not None and line.lower() == current_named:
-                final_print(indent, line)
+def parse_record(filepath, record, data):
+    record["table"] = parse_tab_lines(text_lines(data)) if filepath.endswith(".tab") else None
+    record["blocks"] = [parse_block_tables(block_lines) for block_lines in extract_file_blocks(text_lines(data)).values()]
+    record["names"] = [name for name, parsed_tables in record["blocks"]]
+    record["parsed"] = True
+
+def list_campaigns(root="."):
+    """
+    The subdirectories of a collection root that hold .tab/.txt files, sorted.
+    """
+    return sorted(entry.name for entry in os.scandir(root) if entry.is_dir() and
+                  (glob.glob(os.path.join(glob.escape(entry.path), "*.tab")) or
+                   glob.glob(os.path.join(glob.escape(entry.path), "*.txt"))))
+
+class Deferred:
+    """
+    Stands in for a table or named block whose file has not been parsed yet.
+    The first use parses the file, puts the real tables and blocks into the
+    store's dicts in place of their Deferreds, and forwards to the real one.
+    """
+    __slots__ = ("store", "filepath", "kind", "name", "target")
+
+    def __init__(self, store, filepath, kind, name):
+        self.store = store
+        self.filepath = filepath
+        self.kind = kind
+        self.name = name
+        self.target = None
+
+    def resolve(self):
+        if self.target is None:
+            self.target = self.store.load(self.filepath, self.kind, self.name)
+        return self.target
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __iter__(self):
+        return iter(self.resolve())
+
+    def __len__(self):
+        return len(self.resolve())
+
+class TableStore:
+    """
+    Tables and named-block rules for the .tab/.txt files of a collection: the
+    files directly in root (the working directory by default) and, with a
+    campaign, those in the root/campaign subdirectory, whose tables and blocks
+    take the place of base ones with the same name.
+    Each file is indexed once for the named blocks it defines and only parsed
+    the first time one of its tables or blocks is used; until then the dicts
+    hold Deferred stand-ins. The index and the parse results are cached per file
+    in cache_path (relative to root); a file is indexed again only when its mtime
+    or size changed and its content hash no longer matches.
+    graph is the CallGraph of the current dicts, rebuilt along with them; passing
+    it on (graph=) lets resolutions share its recursion sets and fragment cache.
+    """
+    def __init__(self, cache_path=CACHE_FILE, root=".", campaign=None):
+        self.root = root
+        self.campaign = campaign
+        self.dirs = [""] + ([campaign] if campaign else [])
+        self.cache_path = os.path.join(root, cache_path) if cache_path else None
+        self.files = self._read_cache() if cache_path else {}
+        self.tables = {}
+        self.named_rules = {}
+        self.graph = None
+        self.dirty = False
+        self.built = False
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get("version") != CACHE_VERSION:
+                return {}
+            files = data["files"]
+            memo = {}
+            for record in files.values():
+                if record["table"] is not None:
+                    record["table"] = RollTable.from_state(record["table"], memo)
+                if record["blocks"] is not None:
+                    record["blocks"] = [(name, [(notation, RollTable.from_state(t, memo)) for notation, t in parsed])
+                                        for name, parsed in record["blocks"]]
+            return files
+        except Exception:
+            # Missing, stale or unreadable cache: index everything again.
+            return {}
+
+    def paths(self):
+        # The collection's files relative to root, base files first.
+        paths = []
+        for directory in self.dirs:
+            pattern = os.path.join(glob.escape(os.path.join(self.root, directory)), "*")
+            paths += [os.path.relpath(path, self.root) for path in glob.glob(pattern + ".tab") + glob.glob(pattern + ".txt")]
+        return paths
+
+    def read(self, filepath):
+        with open(os.path.join(self.root, filepath), 'rb') as f:
+            return f.read()
+
+    def refresh(self):
+        """
+        Re-stat the table files and re-index only the ones that changed.
+        Returns True if the tables or named blocks were rebuilt.
+        """
+        paths = self.paths()
+        changed = not self.built
+        try:
+            for filepath in paths:
+                st = os.stat(os.path.join(self.root, filepath))
+                record = self.files.get(filepath)
+                if record and record["mtime"] == st.st_mtime_ns and record["size"] == st.st_size:
+                    continue
+                data = self.read(filepath)
+                digest = hashlib.sha1(data).hexdigest()
+                self.dirty = True
+                if record and record["digest"] == digest:
+                    record["mtime"], record["size"] = st.st_mtime_ns, st.st_size
+                    continue
+                self.files[filepath] = index_file(data, digest, st)
+                changed = True
+        except Exception:
+            # Files re-indexed before the failure look unchanged next time,
+            # so make sure the next refresh rebuilds the tables anyway.
+            self.built = False
+            raise
+        current = set(paths)
+        for filepath in [path for path in self.files if os.path.dirname(path) in self.dirs and path not in current]:
+            del self.files[filepath]
+            self.dirty = changed = True
+        if changed:
+            self._build(paths)
+        return changed
+
+    def _build(self, paths):
+        tables = {}
+        named_rules = {}
+        for filepath in paths:
+            record = self.files[filepath]
+            table_name = os.path.splitext(os.path.basename(filepath))[0].lower()
+            if record["parsed"]:
+                if record["table"] is not None:
+                    tables[table_name] = record["table"]
+                for name, parsed_tables in record["blocks"]:
+                    named_rules[name] = NamedBlock(name, parsed_tables)
             else:
-                if line.lower() in resolved_stack:
-                    debug_print(f"{indent}→ [Cycle detected: {line}]")
-                else:
-                    resolved_stack.add(line.lower())
-                    debug_print(f"{indent}→ Resolving named block: {line}")
-                    result = named_rules[line.lower()]()
-                    process_and_resolve_text(result, tables, named_rules, depth + 1, parent_table, current_named=line.lower())
-                    resolved_stack.remove(line.lower())
-            continue
-        if line.startswith('"') and line.endswith('"'):
-            final_print(indent, line[1:-1])
+                if filepath.endswith(".tab"):
+                    tables[table_name] = Deferred(self, filepath, "table", table_name)
+                for name in record["names"]:
+                    named_rules[name] = Deferred(self, filepath, "block", name)
+        self.tables = tables
+        self.named_rules = named_rules
+        self.graph = CallGraph(tables, named_rules)
+        self.built = True
+
+    def load(self, filepath, kind, name):
+        """
+        Parse one indexed file, replace its Deferreds in the current dicts and
+        return its table (kind "table") or named block called name.
+        """
+        record = self.files[filepath]
+        if not record["parsed"]:
+            parse_record(filepath, record, self.read(filepath))
+            self.dirty = True
+        table_name = os.path.splitext(os.path.basename(filepath))[0].lower()
+        found = None
+        if record["table"] is not None:
+            if self.deferred_from(self.tables, table_name, filepath):
+                self.tables[table_name] = record["table"]
+            if kind == "table":
+                found = record["table"]
+        for block_name, parsed_tables in record["blocks"]:
+            block = None
+            if self.deferred_from(self.named_rules, block_name, filepath):
+                block = self.named_rules[block_name] = NamedBlock(block_name, parsed_tables)
+            if kind == "block" and block_name == name:
+                found = block or NamedBlock(block_name, parsed_tables)
+        if found is None:
+            # The file changed since it was indexed; refresh() will catch up.
+            found = RollTable() if kind == "table" else NamedBlock(name, [])
+        return found
+
+    @staticmethod
+    def deferred_from(mapping, name, filepath):
+        value = mapping.get(name)
+        return isinstance(value, Deferred) and value.filepath == filepath
+
+    def load_all(self):
+        # Parse every file of the collection now (e.g. before forking workers).
+        for filepath in self.paths():
+            record = self.files.get(filepath)
+            if record is not None and not record["parsed"]:
+                self.load(filepath, None, None)
+
+    def save(self):
+        if not self.cache_path or not self.dirty:
+            return
+        files = {}
+        memo = {}
+        for filepath, record in self.files.items():
+            table = record["table"]
+            blocks = record["blocks"]
+            files[filepath] = dict(record,
+                                   table=table.state(memo) if table is not None else None,
+                                   blocks=[(name, [(notation, t.state(memo)) for notation, t in parsed])
+                                           for name, parsed in blocks] if blocks is not None else None)
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({"version": CACHE_VERSION, "files": files}, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            # A read-only table directory simply runs without the cache.
+            pass
+        self.dirty = False
+
+# --- Result tree ---
+class ResultNode:
+    """
+    One step of a resolution. "table" and "block" nodes carry the roll, the
+    individual dice and the entry they selected; "output" nodes are the lines the
+    CLI prints; "note", "cycle" and "limit" nodes hold the extra -verbose lines
+    (a cycle skipped silently has no text). Children are kept in resolution order.
+    """
+    __slots__ = ("kind", "name", "roll", "rolls", "entry", "text", "depth", "children")
+
+    def __init__(self, kind, name=None, text=None, depth=0):
+        self.kind = kind
+        self.name = name
+        self.roll = None
+        self.rolls = None
+        self.entry = None
+        self.text = text
+        self.depth = depth
+        self.children = []
+
+    def to_dict(self):
+        # Built with an explicit stack, so deep trees do not hit the recursion limit.
+        root = {}
+        stack = [(self, root)]
+        while stack:
+            node, data = stack.pop()
+            data["kind"] = node.kind
+            for key in ("name", "roll", "rolls", "entry", "text"):
+                value = getattr(node, key)
+                if value is not None:
+                    data[key] = value
+            if node.children:
+                data["children"] = [{} for _ in node.children]
+                stack.extend(zip(node.children, data["children"]))
+        return root
+
+    def outputs(self):
+        """
+        The output lines under this node, in order (what the CLI prints without -verbose).
+        """
+        return list(render_lines(self, verbose=False))
+
+def render_lines(node, verbose=False):
+    """
+    Yield the CLI lines for a result tree: every output line, plus the notes in verbose mode.
+    """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        line = render_node(node, verbose)
+        if line is not None:
+            yield line
+        stack.extend(reversed(node.children))
+
+def render_node(node, verbose=False):
+    # The CLI line for a single node, or None if it prints nothing.
+    if node.kind == "output":
+        # In non-verbose mode, print without any leading spaces.
+        return f"{'  ' * node.depth}→ Output: {node.text}" if verbose else node.text
+    if verbose and node.text is not None:
+        return node.text
+    return None
+
+def render_text(node, verbose=False):
+    return "".join(line + "\n" for line in render_lines(node, verbose))
+
+# --- Helper recording functions ---
+def debug_print(node, msg):
+    # Verbose-only lines become "note" nodes; callers only format them when verbose.
+    node.children.append(ResultNode("note", text=msg))
+
+# --- Instrumentation ---
+class Profiler:
+    """
+    Opt-in instrumentation for the resolver: pass one as profiler= to
+    resolve_table, process_and_resolve_text or resolve_many and it accumulates,
+    over every resolution it sees, per table/block call counts, cumulative and
+    self time, how often each depth was entered, block rerolls, cycle skips and
+    depth cut-offs. Export with to_dict() (JSON-ready) or collapsed() (the
+    collapsed-stack format flamegraph.pl and speedscope read).
+    A Profiler tracks the frames of the resolution in progress, so use one per
+    thread and merge() them afterwards.
+    """
+    def __init__(self):
+        self.calls = Counter()       # (kind, name) -> visits
+        self.cumulative = Counter()  # (kind, name) -> seconds, outermost visits only
+        self.own = Counter()         # (kind, name) -> seconds not spent in callees
+        self.depths = Counter()      # depth -> tables and blocks entered there
+        self.rerolls = Counter()     # block -> rerolls of its own name
+        self.cycles = Counter()      # name -> cycle skips
+        self.limits = 0
+        self.stacks = Counter()      # "a;b;c" -> self seconds
+        self.frames = []             # [kind, name, start, time in callees, stack path]
+        self.active = Counter()
+
+    def enter(self, kind, name, depth):
+        key = (kind, name)
+        self.calls[key] += 1
+        self.depths[depth] += 1
+        self.active[key] += 1
+        path = f"{self.frames[-1][4]};{name}" if self.frames else name
+        self.frames.append([kind, name, time.perf_counter(), 0.0, path])
+
+    def exit(self):
+        kind, name, start, inner, path = self.frames.pop()
+        elapsed = time.perf_counter() - start
+        key = (kind, name)
+        self.active[key] -= 1
+        if not self.active[key]:
+            # A recursive name's time is counted once, at its outermost visit.
+            self.cumulative[key] += elapsed
+        self.own[key] += elapsed - inner
+        self.stacks[path] += elapsed - inner
+        if self.frames:
+            self.frames[-1][3] += elapsed
+
+    def merge(self, other):
+        for counter in ("calls", "cumulative", "own", "depths", "rerolls", "cycles", "stacks"):
+            getattr(self, counter).update(getattr(other, counter))
+        self.limits += other.limits
+
+    def to_dict(self):
+        names = {"table": {}, "block": {}, "text": {}}
+        for (kind, name), calls in sorted(self.calls.items(), key=lambda item: -self.cumulative[item[0]]):
+            names[kind][name] = {"calls": calls, "cumulative": self.cumulative[kind, name],
+                                 "self": self.own[kind, name]}
+        return {
+            "tables": names["table"],
+            "blocks": names["block"],
+            "text": names["text"],
+            "depths": {str(depth): count for depth, count in sorted(self.depths.items())},
+            "rerolls": dict(self.rerolls),
+            "cycles": dict(self.cycles),
+            "limits": self.limits,
+        }
+
+    def collapsed(self):
+        # One "frame;frame;frame microseconds" line per stack, self time only.
+        return "".join(f"{path} {round(seconds * 1e6)}\n" for path, seconds in sorted(self.stacks.items()))
+
+class Resolver:
+    """
+    The state of one resolution call: tables and rules, the dice source,
+    verbosity, the depth limit and the names currently being resolved (for cycle
+    detection). Results go into the ResultNode tree passed down the calls.
+    Nothing is shared between Resolvers, so separate calls can run concurrently
+    in threads or asyncio tasks over the same tables.
+
+    Resolution runs on an explicit work stack rather than Python recursion, so
+    deep chains cost no interpreter frames and max_depth can be raised freely.
+    Work items are ("table", node, parent), ("text", lines, i, j, depth,
+    current_named, node) - line i, resuming at its j-th "Name()" call when
+    j >= 0 - and ("pop", name), which ends a name's entry in the resolved stack.
+    Items are pushed so that they pop in the order the recursive resolver used to
+    run, and nodes are attached when their item pops, so they are created in the
+    same order render_lines walks the finished tree. iter_resolve relies on that
+    to stream nodes instead of building the tree.
+
+    graph is the CallGraph of tables and named_rules (TableStore.graph); without
+    one a new graph is built for this Resolver alone.
+    """
+    def __init__(self, tables, named_rules, rng=None, verbose=VERBOSE, max_depth=MAX_DEPTH, profiler=None,
+                 graph=None):
+        self.tables = tables
+        self.named_rules = named_rules
+        self.rng = rng if rng is not None else random.Random()
+        self.verbose = verbose
+        self.max_depth = max_depth
+        self.resolved_stack = set()
+        # Only names that can call themselves (see CallGraph) go on the resolved stack.
+        graph = self.graph = graph if graph is not None else CallGraph(tables, named_rules)
+        self.recursive = graph.recursive
+        self.fragment = graph.fragment
+        self.profiler = profiler
+        self.events = None  # set while streaming; nodes go here instead of into the tree
+
+    def resolve_table(self, name, depth=0, parent=None):
+        """
+        Roll on a .tab table and resolve the entry. Returns the "table" ResultNode,
+        which is also appended to parent when one is given.
+        """
+        node = ResultNode("table", name=name.lower(), depth=depth)
+        self.graph.settle(node.name)
+        self.run([("table", node, parent)])
+        return node
+
+    def iter_resolve(self, name, depth=0):
+        """
+        Like resolve_table, but yield each ResultNode as soon as it is created
+        instead of building the tree, in render_lines order. Streamed nodes have
+        no children, so memory stays flat however much text a table produces.
+        """
+        events = self.events = []
+        node = ResultNode("table", name=name.lower(), depth=depth)
+        self.graph.settle(node.name)
+        work = [("table", node, None)]
+        yield node
+        try:
+            while work:
+                self.step(work)
+                yield from events
+                events.clear()
+        finally:
+            self.events = None
+
+    def process_text(self, text, depth, current_named=None, node=None):
+        """
+        Resolve the lines of an entry (a string, or lines already tokenized with
+        tokenize_text), appending the results to node (a new "text" root if none
+        is given). Returns the node.
+        """
+        if node is None:
+            node = ResultNode("text")
+        lines = tokenize_text(text) if isinstance(text, str) else text
+        self.graph.settle_lines(lines)
+        work = []
+        if self.profiler is not None:
+            self.profiler.enter("text", current_named or "<text>", depth)
+            work.append(("exit",))
+        work.append(("text", lines, 0, -1, depth, current_named, node))
+        self.run(work)
+        return node
+
+    def add(self, parent, child):
+        if self.events is None:
+            parent.children.append(child)
+        else:
+            self.events.append(child)
+
+    def note(self, node, msg):
+        self.add(node, ResultNode("note", text=msg))
+
+    def output(self, node, depth, msg):
+        self.add(node, ResultNode("output", text=msg, depth=depth))
+
+    def push_block(self, work, name, depth, node):
+        # Roll a named block now and queue its result one level down, under a new "block" node.
+        block = ResultNode("block", name=name, depth=depth)
+        self.add(node, block)
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.enter("block", name, depth)
+            work.append(("exit",))
+        result = self.named_rules[name](self.rng, block, self.verbose, profiler)
+        if self.events is not None:
+            # The block's own notes (dice used, nested rolls) come out right after it.
+            self.events.extend(block.children)
+            block.children = []
+        fragment = self.fragment("block", name, block.roll) if depth <= self.max_depth else None
+        if fragment is not None:
+            for text in fragment:
+                self.output(block, depth, text)
+        else:
+            work.append(("text", result, 0, -1, depth, name, block))
+
+    def enter(self, work, name):
+        # Put a recursive name on the resolved stack until the work queued after this is done.
+        if name in self.recursive:
+            self.resolved_stack.add(name)
+            work.append(("pop", name))
+
+    def run(self, work):
+        while work:
+            self.step(work)
+
+    def step(self, work):
+        item = work.pop()
+        kind = item[0]
+        if kind == "text":
+            self.step_text(work, *item[1:])
+        elif kind == "table":
+            self.step_table(work, item[1], item[2])
+        elif kind == "pop":
+            self.resolved_stack.remove(item[1])
+        else:
+            self.profiler.exit()
+
+    def step_table(self, work, node, parent):
+        if parent is not None:
+            self.add(parent, node)
+        verbose = self.verbose
+        depth = node.depth
+        name = node.name
+        if self.profiler is not None:
+            self.profiler.enter("table", name, depth)
+            work.append(("exit",))
+        indent = "  " * depth if verbose else ""
+        if name not in self.tables:
+            if verbose:
+                self.note(node, f"{indent}[Table not found: {name}]")
+            return
+        roll, rolls = roll_parsed(DEFAULT_ROLL, self.rng)
+        entry = self.tables[name].lookup(roll)
+        node.roll, node.rolls = roll, rolls
+        if verbose:
+            self.note(node, f"{indent}Rolled {roll} on {name}: {entry} (rolls: {rolls})")
+        if not entry:
+            if verbose:
+                self.note(node, f"{indent}[No entry for roll {roll}]")
+            return
+        node.entry = entry.text
+        if entry.quoted is not None:
+            self.output(node, depth, entry.quoted)
+        elif entry.group is not None:
+            for part in reversed(entry.group):
+                work.append(("table", ResultNode("table", name=part.lower(), depth=depth + 1), node))
+        else:
+            fragment = self.fragment("table", name, roll) if depth <= self.max_depth else None
+            if fragment is not None:
+                for text in fragment:
+                    self.output(node, depth, text)
+            else:
+                work.append(("text", entry.lines, 0, -1, depth, None, node))
+
+    def step_text(self, work, lines, i, j, depth, current_named, node):
+        # Resolve lines[i:] until one of them needs a table or block resolved first;
+        # then queue this frame's continuation below that child and return.
+        verbose = self.verbose
+        indent = "  " * depth if verbose else ""
+        if i == 0 and j < 0 and depth > self.max_depth:
+            if self.profiler is not None:
+                self.profiler.limits += 1
+            self.add(node, ResultNode("limit", text=indent + "[Maximum recursion depth reached]", depth=depth))
+            return
+        named_rules = self.named_rules
+        resolved_stack = self.resolved_stack
+        recursive = self.recursive
+        while i < len(lines):
+            line, lower, call, display, calls = lines[i]
+            if j < 0:
+                if call is not None and call in named_rules:
+                    if verbose:
+                        self.note(node, f"{indent}→ Resolving named block: {line}")
+                    work.append(("text", lines, i + 1, -1, depth, current_named, node))
+                    self.push_block(work, call, depth + 1, node)
+                    return
+                if lower in named_rules:
+                    if current_named is not None and lower == current_named:
+                        self.output(node, depth, line)
+                    elif lower in recursive and lower in resolved_stack:
+                        if self.profiler is not None:
+                            self.profiler.cycles[lower] += 1
+                        self.add(node, ResultNode("cycle", name=lower, depth=depth,
+                                                  text=f"{indent}→ [Cycle detected: {line}]"))
+                    else:
+                        if verbose:
+                            self.note(node, f"{indent}→ Resolving named block: {line}")
+                        work.append(("text", lines, i + 1, -1, depth, current_named, node))
+                        self.enter(work, lower)
+                        self.push_block(work, lower, depth + 1, node)
+                        return
+                    i += 1
+                    continue
+                self.output(node, depth, display)
+                j = 0
+            while j < len(calls):
+                match, match_lower = calls[j]
+                j += 1
+                if current_named is not None and match_lower == current_named:
+                    continue
+                if match_lower in recursive and match_lower in resolved_stack:
+                    if self.profiler is not None:
+                        self.profiler.cycles[match_lower] += 1
+                    self.add(node, ResultNode("cycle", name=match_lower, depth=depth))
+                    continue
+                if match_lower in named_rules:
+                    work.append(("text", lines, i, j, depth, current_named, node))
+                    self.enter(work, match_lower)
+                    self.push_block(work, match_lower, depth + 1, node)
+                    return
+                if match_lower in self.tables:
+                    work.append(("text", lines, i, j, depth, current_named, node))
+                    self.enter(work, match_lower)
+                    work.append(("table", ResultNode("table", name=match_lower, depth=depth + 1), node))
+                    return
+            i += 1
+            j = -1
+
+def process_and_resolve_text(text, tables, named_rules, depth, parent_table=None, current_named=None, rng=None,
+                             node=None, verbose=VERBOSE, max_depth=MAX_DEPTH, profiler=None, graph=None):
+    """
+    Resolve an entry's text in a fresh Resolver; see Resolver.process_text.
+    rng defaults to a fresh random.Random.
+    """
+    return Resolver(tables, named_rules, rng, verbose, max_depth, profiler, graph).process_text(text, depth,
+                                                                                                current_named, node)
+
+def resolve_table(name, tables, named_rules={}, depth=0, rng=None, parent=None, verbose=VERBOSE, max_depth=MAX_DEPTH,
+                  profiler=None, graph=None):
+    """
+    Roll on a .tab table and resolve the entry in a fresh Resolver. Returns the
+    "table" ResultNode. rng is the resolution's dice source (see resolution_rng);
+    it defaults to a fresh random.Random. profiler is an optional Profiler and
+    graph the tables' CallGraph (see Resolver).
+    """
+    return Resolver(tables, named_rules, rng, verbose, max_depth, profiler, graph).resolve_table(name, depth, parent)
+
+def iter_resolve(name, tables, named_rules={}, rng=None, verbose=VERBOSE, max_depth=MAX_DEPTH, graph=None):
+    """
+    Stream one resolution of a table: yield its ResultNodes ("table", "block",
+    "output", ...) as they are resolved, without building the tree. The same rng
+    gives the same nodes, in the same order, as render_lines over resolve_table.
+    """
+    return Resolver(tables, named_rules, rng, verbose, max_depth, graph=graph).iter_resolve(name)
+
+def iter_lines(name, tables, named_rules={}, rng=None, verbose=VERBOSE, max_depth=MAX_DEPTH, graph=None):
+    """
+    Stream the CLI lines of one resolution (see render_lines) as they are resolved.
+    """
+    for node in iter_resolve(name, tables, named_rules, rng, verbose, max_depth, graph):
+        line = render_node(node, verbose)
+        if line is not None:
+            yield line
+
+def resolve_many(table, n, seed=None, tables=None, named_rules=None, start=0, max_depth=MAX_DEPTH, profiler=None,
+                 graph=None):
+    """
+    Run n independent resolutions of one table. Returns the list of "table"
+    ResultNodes. Tables are loaded through TableStore when not given.
+    Unseeded, the whole batch draws from one shared DicePool. Seeded, resolution
+    i rolls on resolution_rng(seed, table, i) for i in start..start+n-1, so a
+    batch split into ranges (or across processes) gives exactly the same results.
+    """
+    if tables is None:
+        store = TableStore()
+        store.refresh()
+        store.save()
+        tables, named_rules, graph = store.tables, store.named_rules, store.graph
+    name = table.lower()
+    named_rules = named_rules or {}
+    if graph is None:
+        graph = CallGraph(tables, named_rules)  # shared by the whole batch
+    if seed is None:
+        pool = DicePool()
+        return [resolve_table(name, tables, named_rules, rng=pool, max_depth=max_depth, profiler=profiler, graph=graph)
+                for _ in range(n)]
+    return [resolve_table(name, tables, named_rules, rng=resolution_rng(seed, name, index), max_depth=max_depth,
+                          profiler=profiler, graph=graph)
+            for index in range(start, start + n)]
+
+# --- Exact outcome analysis ---
+@lru_cache(maxsize=None)
+def dice_distribution(dice):
+    """
+    Exact {total: probability} for a (count, sides) pair, by repeated convolution.
+    """
+    count, sides = dice
+    face = Fraction(1, sides)
+    dist = {0: Fraction(1)}
+    for _ in range(count):
+        convolved = {}
+        for total, p in dist.items():
+            for r in range(1, sides + 1):
+                convolved[total + r] = convolved.get(total + r, 0) + p * face
+        dist = convolved
+    return dist
+
+@lru_cache(maxsize=None)
+def dice_sequences(dice, limit=100000):
+    """
+    Every ordered (total, rolls, probability) outcome of a (count, sides) pair.
+    Only needed where the individual dice are printed (nested-roll lines).
+    """
+    count, sides = dice
+    if sides ** count > limit:
+        raise ValueError(f"Too many dice sequences to enumerate for {count}D{sides}")
+    p = Fraction(1, sides ** count)
+    return tuple((sum(rolls), list(rolls), p) for rolls in itertools.product(range(1, sides + 1), repeat=count))
+
+def roll_distribution(table, dice):
+    """
+    {Entry or None: probability} for one roll of dice on a RollTable.
+    """
+    dist = {}
+    for total, p in dice_distribution(dice).items():
+        entry = table.lookup(total)
+        dist[entry] = dist.get(entry, 0) + p
+    return dist
+
+def block_outcomes(block):
+    """
+    Exact distribution of a NamedBlock's result as (probability, entry, lines)
+    triples, including the up-to-ten rerolls of a self-referencing entry.
+    """
+    if block.outer is None:
+        return [(Fraction(1), None, ())]
+    dist = roll_distribution(block.outer, block.dice)
+    def is_self(entry):
+        return entry is not None and block.has_composite and entry.key == block.name
+    p_self = sum((p for entry, p in dist.items() if is_self(entry)), Fraction(0))
+    reached = sum(p_self ** k for k in range(10))  # expected number of attempts made
+    outcomes = []
+    for entry, p in dist.items():
+        if is_self(entry):
+            # Only kept when all ten attempts rolled the block itself.
+            p = p * p_self ** 9
         else:
-            final_print(indent, line)
-        matches = re.findall(r'([A-Za-z0-9_\-]+)\(\)', line)
-        for match in matches:
-            match_lower = match.lower()
-            if current_named is not None and match_lower == current_named:
+            p = p * reached
+        if entry is None:
+            outcomes.append((p, None, ()))
+        elif entry.parts is None:
+            outcomes.append((p, entry, entry.lines))
+        else:
+            result = block.composites[entry]
+            if isinstance(result, tuple):
+                outcomes.append((p, entry, result))
+            else:
+                for q, lines in nested_outcomes(block, result):
+                    outcomes.append((p * q, entry, lines))
+    return outcomes
+
+def nested_outcomes(block, parts):
+    # Each "(" part of a composite makes its own roll on the block's nested table.
+    subdice, subtable = block.nested
+    variants = [(Fraction(1), [])]
+    for part in parts:
+        if part.startswith("("):
+            variants = [(q * p, output + [block.nested_line(total, rolls, subtable.lookup(total))])
+                        for q, output in variants for total, rolls, p in dice_sequences(subdice)]
+        else:
+            variants = [(q, output + [part]) for q, output in variants]
+    return [(q, tokenize_text("\n".join(output))) for q, output in variants]
+
+def add_counts(counts, other, scale=1):
+    for key, value in other.items():
+        counts[key] = counts.get(key, 0) + value * scale
+
+class OutcomeAnalyzer:
+    """
+    Exact expected counts for one resolution of a table or named block, following
+    the same rules as resolve_table and process_and_resolve_text. Counts are keyed
+    ("output", text), ("table", name), ("block", name), ("cycle", name) and
+    ("limit",). Each (table or block, depth, resolved stack, current block) state
+    is evaluated once and memoized, so no sampling is involved. As at run time,
+    only names that can recurse (see CallGraph) go on the resolved stack, so a
+    name reached along several acyclic paths shares one memo entry.
+    """
+    def __init__(self, tables, named_rules, max_depth=MAX_DEPTH, graph=None):
+        self.tables = tables
+        self.named_rules = named_rules
+        self.max_depth = max_depth
+        self.graph = graph if graph is not None else CallGraph(tables, named_rules)
+        self.recursive = self.graph.recursive
+        self.memo = {}
+        self.block_memo = {}
+
+    def outcomes(self, name):
+        if name not in self.block_memo:
+            self.block_memo[name] = block_outcomes(self.named_rules[name])
+        return self.block_memo[name]
+
+    def table(self, name, depth=0, stack=frozenset()):
+        key = ("table", name, depth, stack)
+        if key in self.memo:
+            return self.memo[key]
+        counts = {("table", name): 1}
+        if name in self.tables:
+            for entry, p in roll_distribution(self.tables[name], DEFAULT_ROLL).items():
+                if entry is None:
+                    continue
+                if entry.quoted is not None:
+                    add_counts(counts, {("output", entry.quoted): 1}, p)
+                elif entry.group is not None:
+                    for part in entry.group:
+                        add_counts(counts, self.table(part, depth + 1, stack), p)
+                else:
+                    add_counts(counts, self.text(entry.lines, depth, None, stack), p)
+        self.memo[key] = counts
+        return counts
+
+    def block(self, name, depth=0, stack=frozenset()):
+        key = ("block", name, depth, stack)
+        if key in self.memo:
+            return self.memo[key]
+        counts = {("block", name): 1}
+        for p, entry, lines in self.outcomes(name):
+            add_counts(counts, self.text(lines, depth, name, stack), p)
+        self.memo[key] = counts
+        return counts
+
+    def text(self, lines, depth, current_named, stack):
+        if depth > self.max_depth:
+            return {("limit",): 1}
+        key = ("text", lines, depth, current_named, stack)
+        if key in self.memo:
+            return self.memo[key]
+        counts = {}
+        named_rules = self.named_rules
+        for line, lower, call, display, calls in lines:
+            if call is not None and call in named_rules:
+                add_counts(counts, self.block(call, depth + 1, stack))
                 continue
-            if match_lower in resolved_stack:
+            if lower in named_rules:
+                if current_named is not None and lower == current_named:
+                    add_counts(counts, {("output", line): 1})
+                elif lower in stack:
+                    add_counts(counts, {("cycle", lower): 1})
+                else:
+                    add_counts(counts, self.block(lower, depth + 1, self.enter(stack, lower)))
                 continue
-            resolved_stack.add(match_lower)
-            if match_lower in named_rules:
-                result = named_rules[match_lower]()
-                process_and_resolve_text(result, tables, named_rules, depth + 1, parent_table, current_named=match_lower)
-            elif match_lower in tables:
-                resolve_table(match_lower, tables, named_rules, depth + 1)
-            resolved_stack.remove(match_lower)
-
-def resolve_table(name, tables, named_rules={}, depth=0):
-    indent = "  " * depth if VERBOSE else ""
+            add_counts(counts, {("output", display): 1})
+            for match, match_lower in calls:
+                if current_named is not None and match_lower == current_named:
+                    continue
+                if match_lower in stack:
+                    add_counts(counts, {("cycle", match_lower): 1})
+                    continue
+                if match_lower in named_rules:
+                    add_counts(counts, self.block(match_lower, depth + 1, self.enter(stack, match_lower)))
+                elif match_lower in self.tables:
+                    add_counts(counts, self.table(match_lower, depth + 1, self.enter(stack, match_lower)))
+        self.memo[key] = counts
+        return counts
+
+    def enter(self, stack, name):
+        # The resolved stack below a call to name; see Resolver.enter.
+        return stack | {name} if name in self.recursive else stack
+
+def analyze(name, tables, named_rules, graph=None):
+    """
+    Exact analysis of one table (or, failing that, named block): the distribution
+    of its own roll and entries, and the expected count of every output line,
+    table/block visit, cycle skip and depth cut-off per resolution. Probabilities
+    are Fractions. Returns None if the name is unknown, and raises ValueError if
+    a nested roll has too many dice sequences to enumerate. graph is the tables'
+    CallGraph if there is one already (see TableStore).
+    """
+    analyzer = OutcomeAnalyzer(tables, named_rules, graph=graph)
     name = name.lower()
-    if name not in tables:
-        debug_print(f"{indent}[Table not found: {name}]")
-        return
-    table = tables[name]
-    roll, rolls = roll_dice(DEFAULT_DICE)
-    entry = next((content for r, content in table if r == roll), None)
-    debug_print(f"{indent}Rolled {roll} on {name}: {entry} (rolls: {rolls})")
-    if not entry:
-        debug_print(f"{indent}[No entry for roll {roll}]")
-        return
-    if entry.startswith('"') and entry.endswith('"'):
-        final_print(indent, entry[1:-1])
-        return
-    if entry.startswith('[[') and entry.endswith(']]'):
-        inner = entry[2:-2]
-        parts = [p.strip().replace("()", "").lower() for p in inner.split("&")]
-        for part in parts:
-            resolve_table(part, tables, named_rules, depth + 1)
-        return
-    process_and_resolve_text(entry, tables, named_rules, depth, parent_table=name, current_named=None)
+    if name in tables or name in named_rules:
+        analyzer.graph.settle(name)
+    if name in tables:
+        kind, dice = "table", DEFAULT_ROLL
+        entries = roll_distribution(tables[name], dice)
+        counts = analyzer.table(name)
+    elif name in named_rules and named_rules[name].outer is not None:
+        block = named_rules[name]
+        kind, dice = "block", block.dice
+        entries = {}
+        for p, entry, lines in analyzer.outcomes(name):
+            entries[entry] = entries.get(entry, 0) + p
+        counts = analyzer.block(name)
+    else:
+        return None
+    def by_kind(kind):
+        found = {key[-1]: value for key, value in counts.items() if key[0] == kind}
+        return dict(sorted(found.items(), key=lambda item: -item[1]))
+    return {
+        "name": name,
+        "kind": kind,
+        "dice": f"{dice[0]}D{dice[1]}",
+        "rolls": dice_distribution(dice),
+        "entries": {(entry.text if entry is not None else None): p for entry, p in entries.items()},
+        "outputs": by_kind("output"),
+        "tables": by_kind("table"),
+        "blocks": by_kind("block"),
+        "cycles": by_kind("cycle"),
+        "limit": counts.get(("limit",), 0),
+    }
+
+def format_analysis(report):
+    lines = [f"=== {report['name']} ({report['kind']}, {report['dice']}) ==="]
+    lines.append("Entry probabilities:")
+    lines += [f"  {float(p):8.4%}  {entry}" for entry, p in report["entries"].items()]
+    lines.append("Expected outputs per resolution:")
+    lines += [f"  {float(count):9.5f}  {text}" for text, count in report["outputs"].items()]
+    lines.append("Expected visits:")
+    lines += [f"  {float(count):9.5f}  {kind[:-1]} {name}" for kind in ("tables", "blocks")
+              for name, count in report[kind].items()]
+    for name, count in report["cycles"].items():
+        lines.append(f"  {float(count):9.5f}  cycle skipped at {name}")
+    if report["limit"]:
+        lines.append(f"  {float(report['limit']):9.5f}  depth limit reached")
+    return "\n".join(lines) + "\n"
+
+def analysis_to_json(report):
+    # Probabilities as floats; the exact Fractions stay available from analyze().
+    def floats(mapping):
+        return {str(key): float(value) for key, value in mapping.items()}
+    return {key: floats(value) if isinstance(value, dict) else
+                 float(value) if isinstance(value, Fraction) else value
+            for key, value in report.items()}
+
+# --- Call graph and lint ---
+def entry_refs(entry, named_rules, owner=None, nested=False):
+    """
+    The names an entry hands to the resolver when it is rolled: the parts of a
+    [[A() & B()]] group, lines naming a block and "Name()" calls. owner is the
+    block the entry belongs to, whose own name is printed rather than resolved.
+    A nested entry is only ever printed inside a nested-roll line, so only its
+    "Name()" calls count.
+    """
+    if nested:
+        return [match.lower() for match in CALL_RE.findall(entry.text) if match.lower() != owner]
+    if entry.group is not None:
+        return list(entry.group)
+    if entry.quoted is not None and owner is None:
+        return []
+    lines = entry.lines
+    if entry.parts is not None and owner is not None:
+        lines = tokenize_text("\n".join(part for part, lower in entry.parts if lower != owner))
+    refs = []
+    for line, lower, call, display, calls in lines:
+        if call is not None and call in named_rules:
+            refs.append(call)
+        elif lower in named_rules:
+            if lower != owner:
+                refs.append(lower)
+        else:
+            refs.extend(match_lower for match, match_lower in calls if match_lower != owner)
+    return refs
+
+def reachable_entries(table, dice):
+    # The entries a roll of dice can select, in roll order, each once.
+    low, high = dice[0], dice[0] * dice[1]
+    seen = {}
+    for start, end, entry in table:
+        if start <= high and end >= low:
+            seen.setdefault(id(entry), entry)
+    return list(seen.values())
+
+def block_tables(block):
+    """
+    (dice, RollTable, nested) for the tables of a NamedBlock that are actually
+    rolled: the outer table, and the nested one when a composite has a "(" part.
+    """
+    if block.outer is None:
+        return []
+    rolled = [(block.dice, block.outer, False)]
+    if block.nested is not None and any(isinstance(result, list) for result in block.composites.values()):
+        rolled.append(block.nested + (True,))
+    return rolled
+
+class CallGraph:
+    """
+    The static call graph of a set of tables and named blocks, keyed by name (the
+    resolved stack does not tell a table from a block of the same name either).
+    Strongly connected components are found with Tarjan's algorithm, starting
+    from each name the first time it is settled; only the part of the graph
+    reachable from there is linked, so a lazily loaded collection parses just
+    the files that resolution can touch. recursive is the set of settled names
+    that can end up calling themselves, and only those need cycle bookkeeping at
+    run time. dangling lists the (owner, name) references of linked names that
+    are neither a table nor a named block.
+    fragment(kind, name, roll) is a bounded LRU cache of pure_output, so an
+    entry that resolves to fixed text is only walked once per roll.
+    """
+    def __init__(self, tables, named_rules):
+        self.tables = tables
+        self.named_rules = named_rules
+        self.fragment = lru_cache(maxsize=FRAGMENT_CACHE)(self.pure_output)
+        self.edges = {}
+        self.dangling = []
+        self.cycles = []
+        self.recursive = set()
+        self.settled = set()
+
+    def targets(self, name):
+        # The names a table or block called name can resolve, linked on first use.
+        if name not in self.edges:
+            targets = set()
+            if name in self.tables:
+                self.link(name, "table", self.tables[name], DEFAULT_ROLL, False, targets)
+            if name in self.named_rules:
+                for dice, table, nested in block_tables(self.named_rules[name]):
+                    self.link(name, "block", table, dice, nested, targets)
+            self.edges[name] = targets
+        return self.edges[name]
+
+    def link(self, name, kind, table, dice, nested, targets):
+        tables, named_rules = self.tables, self.named_rules
+        owner = name if kind == "block" else None
+        for entry in reachable_entries(table, dice):
+            for ref in entry_refs(entry, named_rules, owner, nested):
+                if ref in tables or (ref in named_rules and entry.group is None):
+                    targets.add(ref)
+                else:
+                    self.dangling.append((f"{kind} {name}", ref))
+
+    def settle(self, name):
+        """
+        Make sure name and everything it can reach have a known recursive status.
+        """
+        if name not in self.settled:
+            for scc in self.components(name):
+                if len(scc) > 1 or scc[0] in self.edges[scc[0]]:
+                    self.cycles.append(scc)
+                    self.recursive.update(scc)
+                self.settled.update(scc)
+
+    def settle_lines(self, lines):
+        # Settle every name a piece of tokenized text can resolve directly.
+        for line, lower, call, display, calls in lines:
+            for name in (call, lower, *(match_lower for match, match_lower in calls)):
+                if name is not None and (name in self.tables or name in self.named_rules):
+                    self.settle(name)
+
+    def settle_all(self):
+        for name in itertools.chain(self.tables, self.named_rules):
+            self.settle(name)
+
+    def pure_output(self, kind, name, roll):
+        """
+        The output lines of the entry roll selects on a table or block, when
+        resolving it takes no further rolls, calls or cycle checks; None otherwise.
+        """
+        named_rules = self.named_rules
+        owner = None
+        if kind == "table":
+            entry = self.tables[name].lookup(roll)
+            lines = entry.lines if entry is not None else ()
+        else:
+            block = named_rules[name]
+            owner = name
+            entry = block.outer.lookup(roll) if block.outer is not None else None
+            if entry is None:
+                lines = ()
+            elif entry.parts is None:
+                lines = entry.lines
+            else:
+                lines = block.composites[entry]
+                if not isinstance(lines, tuple):
+                    return None  # rolls the nested table
+        texts = []
+        for line, lower, call, display, calls in lines:
+            if call is not None and call in named_rules:
+                return None
+            if lower in named_rules:
+                if lower != owner:
+                    return None
+                texts.append(line)
+                continue
+            for match, match_lower in calls:
+                if match_lower != owner and (match_lower in named_rules or match_lower in self.tables):
+                    return None
+            texts.append(display)
+        return tuple(texts)
+
+    def components(self, root):
+        # Tarjan's strongly connected components of the unsettled names reachable
+        # from root, iteratively.
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        found = []
+        settled = self.settled
+        work = [(root, iter(self.targets(root)))]
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            name, targets = work[-1]
+            for target in targets:
+                if target in settled:
+                    continue
+                if target not in index:
+                    index[target] = low[target] = len(index)
+                    stack.append(target)
+                    on_stack.add(target)
+                    work.append((target, iter(self.targets(target))))
+                    break
+                if target in on_stack:
+                    low[name] = min(low[name], index[target])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[name])
+                if low[name] == index[name]:
+                    scc = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        scc.append(member)
+                        if member == name:
+                            break
+                    found.append(sorted(scc))
+        return found
+
+FRAGMENT_CACHE = 4096  # (table or block, roll) outputs kept per CallGraph
+
+def format_ranges(ranges):
+    # [(1, 3), (7, 7)] -> "1-3, 7"
+    return ", ".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+def lint_ranges(owner, table, dice, overlaps=True):
+    """
+    Findings for one RollTable rolled with dice: rolls with no entry, and, unless
+    overlaps is False, lines shadowed by earlier ones or outside what the dice can
+    roll. Works on ranges throughout, so a d1000 table costs no more than its lines.
+    """
+    findings = []
+    low, high = dice[0], dice[0] * dice[1]
+    notation = f"{dice[0]}D{dice[1]}"
+    missing = table.gaps(low, high)
+    if missing:
+        findings.append({"kind": "gap", "name": owner,
+                         "message": f"no entry for roll {format_ranges(missing)} on {notation}"})
+    if not overlaps:
+        return findings
+    shadowed = {}
+    for slot, start, end in table.overlaps:
+        shadowed.setdefault(slot, []).append((start, end))
+    for slot, ((start, end), entry) in enumerate(zip(table.spans, table.entries)):
+        if slot in shadowed:
+            findings.append({"kind": "overlap", "name": owner,
+                             "message": f"'{entry}' ({start}-{end}): roll {format_ranges(shadowed[slot])} already taken by an earlier line"})
+        unreachable = [(a, b) for a, b in ((start, min(end, low - 1)), (max(start, high + 1), end)) if a <= b]
+        if unreachable:
+            findings.append({"kind": "unreachable", "name": owner,
+                             "message": f"'{entry}' ({start}-{end}): roll {format_ranges(unreachable)} never comes up on {notation}"})
+    return findings
+
+def lint(tables, named_rules, graph=None):
+    """
+    Check the loaded tables and named blocks without rolling anything. Returns a
+    list of {"kind", "name", "message"} findings: dangling references, roll gaps,
+    overlapping lines, lines the dice cannot reach, sub-tables that are never
+    rolled, and the groups of names that can recurse into each other.
+    File tables always roll 1D12 over every line of their file, so only their
+    gaps are reported; their other lines belong to the file's named blocks.
+    graph is the tables' CallGraph if there is one already (see TableStore).
+    """
+    if graph is None:
+        graph = CallGraph(tables, named_rules)
+    graph.settle_all()
+    findings = [{"kind": "dangling", "name": owner, "message": f"{ref}() is neither a table nor a named block"}
+                for owner, ref in graph.dangling]
+    for name, table in tables.items():
+        findings += lint_ranges(f"table {name}", table, DEFAULT_ROLL, overlaps=False)
+    for name, block in named_rules.items():
+        rolled = block_tables(block)
+        for dice, table, nested in rolled:
+            findings += lint_ranges(f"block {name}", table, dice)
+        for number, (notation, table) in enumerate(block.parsed_tables, 1):
+            if all(table is not other for dice, other, nested in rolled):
+                first = table.entries[0] if table.entries else None
+                findings.append({"kind": "unused", "name": f"block {name}",
+                                 "message": f"sub-table {number} (starting '{first}') is never rolled"})
+    for scc in graph.cycles:
+        findings.append({"kind": "cycle", "name": scc[0], "message": "can recurse: " + " -> ".join(scc)})
+    return findings
+
+def format_lint(findings):
+    return "".join(f"[{finding['kind']}] {finding['name']}: {finding['message']}\n" for finding in findings)
+
+# --- Monte Carlo simulation ---
+SIM_CHUNK = 10000  # Resolutions per work item; each item gets its own derived stream
+
+_sim_store = None  # Tables loaded once per simulation worker process
+
+def _sim_init(cache_path, root=".", campaign=None):
+    global _sim_store
+    _sim_store = TableStore(cache_path, root, campaign)
+    _sim_store.refresh()
+
+def _sim_chunk(job):
+    name, count, stream = job
+    return simulate_chunk(name, count, stream, _sim_store.tables, _sim_store.named_rules, _sim_store.graph)
+
+def simulate_chunk(name, count, stream, tables, named_rules, graph=None):
+    """
+    Resolve a table count times on the stream derive_random(*stream). Returns
+    histograms of the output lines, of the deepest nesting reached per resolution
+    and of cycle skips by name, plus the number of depth cut-offs.
+    """
+    pool = DicePool(derive_random(*stream))
+    if graph is None:
+        graph = CallGraph(tables, named_rules)
+    outputs, depths, cycles = Counter(), Counter(), Counter()
+    limits = 0
+    for _ in range(count):
+        stack = [resolve_table(name, tables, named_rules, rng=pool, graph=graph)]
+        deepest = 0
+        while stack:
+            node = stack.pop()
+            if node.depth > deepest:
+                deepest = node.depth
+            if node.kind == "output":
+                outputs[node.text] += 1
+            elif node.kind == "cycle":
+                cycles[node.name] += 1
+            elif node.kind == "limit":
+                limits += 1
+            stack.extend(node.children)
+        depths[deepest] += 1
+    return outputs, depths, cycles, limits
+
+def simulate(name, n, seed=None, workers=None, cache_path=CACHE_FILE, chunk=SIM_CHUNK, root=".", campaign=None):
+    """
+    Run n resolutions of a table across a multiprocessing pool and merge the
+    histograms. The work is cut into fixed chunks, each with its own stream derived
+    from (seed, table, chunk index), so a seeded run gives the same totals for any
+    number of workers. workers=1 runs in this process.
+    """
+    if seed is None:
+        seed = random.SystemRandom().randrange(2 ** 32)
+    jobs = [(name, min(chunk, n - start), (seed, name, "chunk", index))
+            for index, start in enumerate(range(0, n, chunk))]
+    report = {"name": name, "n": n, "seed": seed,
+              "outputs": Counter(), "depths": Counter(), "cycles": Counter(), "limits": 0}
+    def merge(results):
+        for outputs, depths, cycles, limits in results:
+            report["outputs"].update(outputs)
+            report["depths"].update(depths)
+            report["cycles"].update(cycles)
+            report["limits"] += limits
+    if workers == 1 or len(jobs) <= 1:
+        store = TableStore(cache_path, root, campaign)
+        store.refresh()
+        merge(simulate_chunk(*job, store.tables, store.named_rules, store.graph) for job in jobs)
+    else:
+        import multiprocessing  # only -simulate needs it; keep it off the one-shot CLI path
+        with multiprocessing.Pool(workers, initializer=_sim_init, initargs=(cache_path, root, campaign)) as pool:
+            merge(pool.imap_unordered(_sim_chunk, jobs))
+    return report
+
+def format_simulation(report):
+    n = report["n"]
+    lines = [f"=== {report['name']}: {n} resolutions (seed {report['seed']}) ==="]
+    lines.append("Output frequency per resolution:")
+    lines += [f"  {count / n:9.5f}  {text}" for text, count in report["outputs"].most_common()]
+    lines.append("Deepest nesting reached:")
+    lines += [f"  depth {depth:3d}: {count / n:8.4%}" for depth, count in sorted(report["depths"].items())]
+    if report["cycles"]:
+        lines.append("Cycle skips per resolution:")
+        lines += [f"  {count / n:9.5f}  {name}" for name, count in report["cycles"].most_common()]
+    lines.append(f"Depth limit reached: {report['limits']} times")
+    return "\n".join(lines) + "\n"
+
+def find_table(user_input, tables):
+    """
+    Match a user-supplied table name, ignoring case, '-' and '_'. Returns None if absent.
+    """
+    normalized = user_input.lower().replace("-", "").replace("_", "")
+    candidates = [k for k in tables if k.replace("-", "").replace("_", "") == normalized]
+    return candidates[0] if candidates else None
+
+# --- Run files ---
+def read_run_file(path):
+    """
+    The table names of a run file such as new-passage.run: one per line, blank
+    lines and '#' comments skipped.
+    """
+    with open(path, 'r') as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+
+def run_sections(names, repeat, seed=None, tables=None, named_rules=None, max_depth=MAX_DEPTH, profiler=None,
+                 graph=None):
+    """
+    Resolve the tables of a run file (already matched with find_table) in order,
+    repeat times over, yielding one {"index": i, "results": [{"table", "output"},
+    ...]} dict per pass as it is finished. Seeded, the k-th resolution of a table
+    in the whole run rolls on resolution_rng(seed, table, k), just as repeating
+    the names on the command line with -seed would; unseeded, every pass draws
+    from one shared DicePool.
+    """
+    if tables is None:
+        store = TableStore()
+        store.refresh()
+        store.save()
+        tables, named_rules, graph = store.tables, store.named_rules, store.graph
+    named_rules = named_rules or {}
+    if graph is None:
+        graph = CallGraph(tables, named_rules)
+    pool = DicePool() if seed is None else None
+    occurrences = Counter()
+    for index in range(repeat):
+        results = []
+        for name in names:
+            if pool is None:
+                rng = resolution_rng(seed, name, occurrences[name])
+                occurrences[name] += 1
+            else:
+                rng = pool
+            resolver = Resolver(tables, named_rules, rng, max_depth=max_depth, profiler=profiler, graph=graph)
+            results.append({"table": name,
+                            "output": [node.text for node in resolver.iter_resolve(name) if node.kind == "output"]})
+        yield {"index": index, "results": results}
+
+def answer_request(store, request):
+    """
+    Answer one decoded JSON request from an already refreshed store:
+      {"table": "room", "seed": 42}     (optional: "index": 0, "verbose": true, "tree": true)
+    resolves a table into {"table": "room", "seed": 42, "output": [...]};
+      {"op": "analyze", "table": "hazard"}  and  {"op": "lint"}
+    return {"op": "analyze", "table": ..., "report": ...} (see analysis_to_json)
+    and {"op": "lint", "findings": [...]}. Anything wrong gives {"error": ...}.
+    A seeded request rolls on resolution_rng(seed, table, index), so it matches
+    "text.py <table> -seed S" and resolve_many(table, n, S). "tree" adds the full
+    result tree to the response.
+    """
+    try:
+        op = request.get("op", "resolve")
+        if op == "lint":
+            return {"op": "lint", "findings": lint(store.tables, store.named_rules, store.graph)}
+        user_input = str(request["table"])
+        if op not in ("resolve", "analyze"):
+            raise ValueError(f"unknown op {op!r}")
+        seed = request.get("seed")
+        index = int(request.get("index", 0))
+        verbose = bool(request.get("verbose", False))
+        want_tree = bool(request.get("tree", False))
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return {"error": f"Bad request: {e}"}
+    table_name = find_table(user_input, store.tables)
+    if op == "analyze":
+        try:
+            report = analyze(table_name or user_input, store.tables, store.named_rules, store.graph)
+        except ValueError as e:
+            return {"error": f"Cannot analyze '{user_input}': {e}"}
+        if report is None:
+            return {"error": f"Table '{user_input}' not found", "available": list(store.tables)}
+        return {"op": "analyze", "table": report["name"], "report": analysis_to_json(report)}
+    if table_name is None:
+        return {"error": f"Table '{user_input}' not found", "available": list(store.tables)}
+    node = resolve_table(table_name, store.tables, store.named_rules,
+                         rng=resolution_rng(seed, table_name, index), verbose=verbose, graph=store.graph)
+    response = {"table": table_name, "seed": seed, "output": list(render_lines(node, verbose))}
+    if want_tree:
+        response["tree"] = node.to_dict()
+    return response
+
+def serve(store, infile=None, outfile=None):
+    """
+    Resident mode: keep the tables parsed and answer one JSON request per line
+    (see answer_request) with one JSON line each; a request's "id", if any, is
+    echoed back. Table files that changed on disk are re-parsed before each request;
+    if that fails (say a file is unreadable), or answering the request fails, the
+    request gets an error and the next one tries again.
+    """
+    infile = infile or sys.stdin
+    outfile = outfile or sys.stdout
+    for line in infile:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            response = {"error": f"Bad request: {e}"}
+        else:
+            try:
+                store.refresh()
+                store.save()
+            except Exception as e:
+                response = {"error": f"Could not read the tables: {e}"}
+            else:
+                try:
+                    response = answer_request(store, request)
+                except Exception as e:
+                    # Keep serving the requests that follow.
+                    response = {"error": f"Internal error: {e!r}"}
+            if isinstance(request, dict) and "id" in request:
+                response["id"] = request["id"]
+        outfile.write(json.dumps(response) + "\n")
+        outfile.flush()
+
+# --- Async service ---
+SERVICE_BATCH = 256  # Most requests answered per pass of the service loop
+
+def static_key(request):
+    # Requests whose answer depends only on the tables (analyses, lint); None otherwise.
+    if not isinstance(request, dict):
+        return None
+    op = request.get("op", "resolve")
+    if op == "lint":
+        return ("lint",)
+    if op == "analyze":
+        return ("analyze", str(request.get("table", "")).lower())
+    return None
+
+class ResolutionService:
+    """
+    Answers JSON requests for the asyncio server out of one resident TableStore.
+    Requests queue up and are answered in batches: the store is refreshed once
+    per batch, then every request in it is answered back to back before the
+    event loop gets control again. Analyses and lint results depend only on the
+    tables, so identical ones share a single computation while in flight and are
+    then served from cache until a table file changes.
+    """
+    def __init__(self, store, batch=SERVICE_BATCH):
+        import asyncio  # only -listen needs it; keep it off the one-shot CLI path
+        self.store = store
+        self.batch = batch
+        self.queue = asyncio.Queue()
+        self.cache = {}
+        self.inflight = {}
+        self.stopped = False
+
+    def refresh(self):
+        if self.store.refresh():
+            self.cache.clear()
+        self.store.save()
+
+    async def submit(self, request):
+        import asyncio
+        if self.stopped:
+            return {"error": "The service has stopped"}
+        key = static_key(request)
+        if key is not None and key in self.inflight:
+            return await asyncio.shield(self.inflight[key])
+        future = asyncio.get_running_loop().create_future()
+        if key is not None:
+            self.inflight[key] = future
+        self.queue.put_nowait((request, key, future))
+        # Shielded, so a client hanging up does not cancel the answer others wait for.
+        return await asyncio.shield(future)
+
+    async def run(self):
+        import asyncio
+        jobs = []
+        try:
+            while True:
+                jobs = [await self.queue.get()]
+                while len(jobs) < self.batch and not self.queue.empty():
+                    jobs.append(self.queue.get_nowait())
+                try:
+                    self.refresh()
+                    failure = None
+                except Exception as e:
+                    # Answer this batch with the error; the next batch tries again.
+                    failure = {"error": f"Could not read the tables: {e}"}
+                for request, key, future in jobs:
+                    if failure is not None:
+                        response = failure
+                    elif key in self.cache:
+                        response = self.cache[key]
+                    else:
+                        try:
+                            response = answer_request(self.store, request)
+                        except Exception as e:
+                            # Keep serving everyone else.
+                            response = {"error": f"Internal error: {e!r}"}
+                    if key is not None:
+                        del self.inflight[key]
+                        if "error" not in response:
+                            self.cache[key] = response
+                    if not future.done():
+                        future.set_result(response)
+                await asyncio.sleep(0)
+        finally:
+            self.stop(jobs)
+
+    def stop(self, jobs=()):
+        # Answer everything still waiting so no client hangs once run() is gone.
+        self.stopped = True
+        jobs = list(jobs)
+        while not self.queue.empty():
+            jobs.append(self.queue.get_nowait())
+        for request, key, future in jobs:
+            if not future.done():
+                future.set_result({"error": "The service has stopped"})
+        self.inflight.clear()
+
+    async def handle_connection(self, reader, writer):
+        # Requests on one connection are answered concurrently; match them up by "id".
+        import asyncio
+        lock = asyncio.Lock()
+        tasks = set()
+        async def answer(line):
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = {"error": f"Bad request: {e}"}
+            else:
+                response = await self.submit(request)
+                if isinstance(request, dict) and "id" in request:
+                    response = dict(response, id=request["id"])
+            async with lock:
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.create_task(answer(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+async def serve_async(store, address, batch=SERVICE_BATCH):
+    """
+    Serve JSON-line requests (see answer_request) on address, "HOST:PORT" for
+    TCP or "unix:PATH" for a UNIX socket, until cancelled. If the service's
+    runner task ever stops, the server stops too and its error is raised.
+    """
+    import asyncio
+    service = ResolutionService(store, batch)
+    if address.startswith("unix:"):
+        server = await asyncio.start_unix_server(service.handle_connection, path=address[len("unix:"):])
+    else:
+        host, _, port = address.rpartition(":")
+        server = await asyncio.start_server(service.handle_connection, host or None, int(port))
+    runner = asyncio.create_task(service.run())
+    async with server:
+        serving = asyncio.create_task(server.serve_forever())
+        try:
+            # Without the runner every request would hang, so stop if it ever exits.
+            await asyncio.wait((serving, runner), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            serving.cancel()
+            runner.cancel()
+        if runner.done() and not runner.cancelled():
+            runner.result()
+            raise RuntimeError("the resolution service stopped")
+
+def pop_option(params, flag, convert=str):
+    # Remove "flag value" from params and return the converted value (None if absent).
+    # A missing or unconvertible value raises ValueError.
+    if flag not in params:
+        return None
+    i = params.index(flag)
+    if i + 1 >= len(params):
+        raise ValueError(f"{flag} needs a value")
+    try:
+        value = convert(params[i + 1])
+    except ValueError:
+        raise ValueError(f"Bad value for {flag}: {params[i + 1]!r}") from None
+    del params[i:i + 2]
+    return value
+
+def print_usage():
+    print("Usage: python text.py <TableName> [<TableName> ...] [-verbose] [-nocache] [-seed S] [-batch N] [-json] [-maxdepth D]")
+    print("       (-profile FILE writes per-table timings as JSON, or collapsed stacks if FILE ends in .folded)")
+    print("       python text.py -analyze <TableName> [...] [-json]   (exact outcome probabilities)")
+    print("       python text.py -simulate N <TableName> [...] [-workers K] [-seed S] [-json]   (sampled statistics)")
+    print("       python text.py -serve [-nocache]   (JSON lines on stdin/stdout)")
+    print("       python text.py -listen HOST:PORT|unix:PATH   (the same JSON lines as an asyncio server)")
+    print("       python text.py -lint [-json]   (check every table without rolling)")
+    print("       python text.py -run FILE [-repeat N] [-seed S]   (resolve a run file's tables N times, JSON lines)")
+    print("       (-root DIR reads the tables of a collection root, -campaign NAME overlays its subdirectory NAME)")
 
 def main():
-    global VERBOSE
     params = sys.argv[1:]
+    verbose = VERBOSE
     if "-verbose" in params:
-        VERBOSE = True
+        verbose = True
         params.remove("-verbose")
-    if len(params) < 1:
-        print("Usage: python map.py <TableName> [<TableName> ...] [-verbose]")
+    cache_path = CACHE_FILE
+    if "-nocache" in params:
+        cache_path = None
+        params.remove("-nocache")
+    analyzing = "-analyze" in params
+    if analyzing:
+        params.remove("-analyze")
+    serving = "-serve" in params
+    if serving:
+        params.remove("-serve")
+    linting = "-lint" in params
+    if linting:
+        params.remove("-lint")
+    as_json = "-json" in params
+    if as_json:
+        params.remove("-json")
+    try:
+        batch = pop_option(params, "-batch", int)
+        simulations = pop_option(params, "-simulate", int)
+        workers = pop_option(params, "-workers", int)
+        seed = pop_option(params, "-seed")
+        max_depth = pop_option(params, "-maxdepth", int)
+        profile_path = pop_option(params, "-profile")
+        root = pop_option(params, "-root") or "."
+        campaign = pop_option(params, "-campaign")
+        run_path = pop_option(params, "-run")
+        listen = pop_option(params, "-listen")
+        repeat = pop_option(params, "-repeat", int)
+    except ValueError as e:
+        print(e)
+        print_usage()
         return
-    tables = load_tables()
-    named_rules = {}
-    raw_blocks = extract_named_blocks()
-    for name, block_lines in raw_blocks.items():
-        key, fn = parse_named_block(block_lines)
-        named_rules[key] = fn
+    if max_depth is None:
+        max_depth = MAX_DEPTH
+    if len(params) < 1 and not (serving or linting or run_path or listen):
+        print_usage()
+        return
+    store = TableStore(cache_path, root, campaign)
+    store.refresh()
+    store.save()
+    if serving:
+        serve(store)
+        return
+    if listen:
+        import asyncio
+        try:
+            asyncio.run(serve_async(store, listen))
+        except KeyboardInterrupt:
+            pass
+        return
+    if linting:
+        findings = lint(store.tables, store.named_rules, store.graph)
+        sys.stdout.write(json.dumps(findings) + "\n" if as_json else format_lint(findings))
+        store.save()
+        return
+    tables, named_rules, graph = store.tables, store.named_rules, store.graph
+    profiler = Profiler() if profile_path else None
+    if run_path:
+        names = []
+        for user_input in read_run_file(run_path):
+            table_name = find_table(user_input, tables)
+            if table_name is None:
+                print(f"[Table '{user_input}' (in {run_path}) not found. Available: {', '.join(tables.keys())}]")
+                return
+            names.append(table_name)
+        # One JSON line per pass, written as it is resolved.
+        write = sys.stdout.write
+        for section in run_sections(names, repeat or 1, seed, tables, named_rules, max_depth, profiler, graph):
+            write(json.dumps(section) + "\n")
+        store.save()
+        write_profile(profiler, profile_path)
+        return
+    # Results are rendered from the result trees and written out once at the end.
+    chunks = []
+    occurrences = Counter()  # k-th resolution of a table rolls on sub-stream k
     for user_input in params:
-        normalized = user_input.lower().replace("-", "").replace("_", "")
-        candidates = [k for k in tables if k.replace("-", "").replace("_", "") == normalized]
-        if not candidates:
-            print(f"[Table '{user_input}' not found. Available: {', '.join(tables.keys())}]")
+        table_name = find_table(user_input, tables)
+        if analyzing:
+            try:
+                report = analyze(table_name or user_input, tables, named_rules, graph)
+            except ValueError as e:
+                # Too many dice sequences to enumerate exactly.
+                chunks.append(f"[Cannot analyze '{user_input}': {e}]\n")
+                continue
+            if report is None:
+                chunks.append(f"[Table '{user_input}' not found. Available: {', '.join(tables.keys())}]\n")
+            elif as_json:
+                chunks.append(json.dumps(analysis_to_json(report)) + "\n")
+            else:
+                chunks.append(format_analysis(report))
+        elif table_name is None:
+            chunks.append(f"[Table '{user_input}' not found. Available: {', '.join(tables.keys())}]\n")
+        elif simulations is not None:
+            report = simulate(table_name, simulations, seed=seed, workers=workers, cache_path=cache_path,
+                              root=root, campaign=campaign)
+            chunks.append(json.dumps(report) + "\n" if as_json else format_simulation(report))
+        elif batch is not None:
+            # One JSON line per resolution.
+            for index, node in enumerate(resolve_many(table_name, batch, seed, tables, named_rules,
+                                                             max_depth=max_depth, profiler=profiler, graph=graph)):
+                result = {"table": table_name, "index": index, "output": node.outputs()}
+                if as_json:
+                    result["tree"] = node.to_dict()
+                chunks.append(json.dumps(result) + "\n")
         else:
-            table_name = candidates[0]
-            if VERBOSE:
-                print(f"\n--- Resolving table '{user_input}' ---")
-            resolve_table(table_name, tables, named_rules)
-            if VERBOSE:
-                print("\n" + "="*50 + "\n")
+            if verbose:
+                chunks.append(f"\n--- Resolving table '{user_input}' ---\n")
+            rng = resolution_rng(seed, table_name, occurrences[table_name])
+            occurrences[table_name] += 1
+            node = resolve_table(table_name, tables, named_rules, rng=rng, verbose=verbose, max_depth=max_depth,
+                                 profiler=profiler, graph=graph)
+            chunks.append(json.dumps(node.to_dict()) + "\n" if as_json else render_text(node, verbose))
+            if verbose:
+                chunks.append("\n" + "="*50 + "\n\n")
     # In non-verbose mode, no extra header, separator, or indentations are printed.
+    sys.stdout.write("".join(chunks))
+    store.save()  # keep the files parsed on the way for the next run
+    write_profile(profiler, profile_path)
+
+def write_profile(profiler, path):
+    # -profile FILE: collapsed stacks for *.folded, JSON otherwise.
+    if profiler is None:
+        return
+    with open(path, "w") as f:
+        f.write(profiler.collapsed() if path.endswith(".folded") else json.dumps(profiler.to_dict(), indent=1) + "\n")
 
 if __name__ == "__main__":
     main()